@@ -1,6 +1,12 @@
 import os
 import json
+import multiprocessing
 import re
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Union
 
 import numpy as np
 from PIL import Image
@@ -8,6 +14,60 @@ from PIL import Image
 import fabio
 from ..cosmic import detect_cosmic_rays
 
+try:
+    import cupy
+except ImportError:  # CuPy is optional and only needed for GPU cosmic ray detection
+    cupy = None
+
+# Seconds between checks of the stop callback while waiting for a directory
+_STOP_POLL_INTERVAL = 0.1
+
+# Number of images which are loaded ahead while combining a directory
+_PREFETCH_DEPTH = 2
+
+
+def _add_unmasked(
+    total_sum: np.ndarray, total_count: np.ndarray, img_data: np.ndarray, mask: np.ndarray
+) -> None:
+    """Add the unmasked pixels of an image to the running sum and count in place."""
+    valid = ~mask
+    np.add(total_sum, img_data, out=total_sum, where=valid)
+    total_count += valid
+
+
+def _sum_replacing_masked(
+    total_sum: np.ndarray, total_count: np.ndarray, num_images: int
+) -> np.ndarray:
+    """Sum images, replacing masked pixels with the average of the other images.
+
+    A masked pixel of an image is replaced with the average of the unmasked
+    pixels at the same position in the other images. As the pixel itself is
+    masked, this is the average of all unmasked pixels, so every masked pixel
+    adds that average to the sum. Pixels which are masked in all images are
+    NaN.
+
+    Parameters
+    ----------
+    total_sum : np.ndarray
+        Sum of the unmasked pixels of all images, updated in place.
+    total_count : np.ndarray
+        Number of unmasked pixels at every position.
+    num_images : int
+        Number of summed images.
+
+    Returns
+    -------
+    np.ndarray
+        The summed image data.
+    """
+    # Cosmic rays are rare, so the replacement is only computed at the masked
+    # positions
+    masked = np.nonzero(total_count < num_images)
+    count = total_count[masked]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total_sum[masked] += (num_images - count) * (total_sum[masked] / count)
+    return total_sum
+
 
 def get_tiff_filenames(directory_path: str) -> list[str]:
     """Get all .tif and .tiff files in the specified directory.
@@ -22,12 +82,23 @@ def get_tiff_filenames(directory_path: str) -> list[str]:
     list
         A list of filenames with .tif or .tiff extension.
     """
-    return [
-        f
-        for f in os.listdir(directory_path)
-        if os.path.isfile(os.path.join(directory_path, f))
-        and f.lower().endswith((".tif", ".tiff"))
-    ]
+    # The directory entries know their type, so no stat call per file is needed
+    with os.scandir(directory_path) as entries:
+        return [
+            entry.name
+            for entry in entries
+            if entry.is_file() and entry.name.lower().endswith((".tif", ".tiff"))
+        ]
+
+
+def _load_image(filename: str) -> np.ndarray:
+    """Load an image as float32 array.
+
+    The detector intensities are 16 bit integers, which float32 represents
+    exactly at half the memory traffic of float64. The cosmic ray statistics
+    and the sums of the images are computed in float64.
+    """
+    return fabio.open(filename).data.astype(np.float32, copy=False)
 
 
 def combine_images_in_directory(
@@ -36,6 +107,8 @@ def combine_images_in_directory(
     cosmic_window: int,
     cosmic_iterations: int,
     cosmic_min: float,
+    log=print,
+    use_gpu: bool = False,
 ) -> np.ndarray:
     """
     Combines all tiff/tif images in the given directory.
@@ -56,6 +129,10 @@ def combine_images_in_directory(
         The number of iterations for the cosmic ray detection.
     cosmic_min : float
         The minimum intensity threshold for the cosmic ray detection.
+    log : callable, optional
+        Function called with every progress message. Default is print.
+    use_gpu : bool, optional
+        Detect the cosmic rays on the GPU. Requires CuPy.
 
     Returns
     -------
@@ -66,49 +143,94 @@ def combine_images_in_directory(
     if not filenames:
         raise FileNotFoundError(f"No files found in {directory_path}")
 
-    imgs = [
-        fabio.open(os.path.join(directory_path, filename)) for filename in filenames
-    ]
-    imgs_data = [img.data.astype(np.float64) for img in imgs]
+    # The filter outputs of the detection are reused for all images of the
+    # directory, which normally have the same shape. They are float64, as the
+    # variance of high-count pixels is lost to cancellation in float32.
+    buffers = None
 
     # Detect cosmic rays with multiple iterations
     def get_cosmic_mask(img_data):
+        nonlocal buffers
+        if buffers is None or buffers[0].shape != img_data.shape:
+            buffers = tuple(np.empty(img_data.shape) for _ in range(3))
         combined_mask = np.zeros_like(img_data, dtype=bool)
         cosmic_counts = []
         for _ in range(cosmic_iterations):
             cosmic_mask = detect_cosmic_rays(
-                img_data, cosmic_sigma, cosmic_window, cosmic_min
+                img_data,
+                cosmic_sigma,
+                cosmic_window,
+                cosmic_min,
+                use_gpu=use_gpu,
+                buffers=buffers,
             )
             img_data[cosmic_mask] = np.nan
-            combined_mask = np.logical_or(combined_mask, cosmic_mask)
+            combined_mask |= cosmic_mask
             cosmic_counts.append(np.sum(cosmic_mask))
-        print(f"        Found cosmic rays: {', '.join(map(str, cosmic_counts))}")
+        log(f"        Found cosmic rays: {', '.join(map(str, cosmic_counts))}")
         return combined_mask
 
-    cosmic_masks = [get_cosmic_mask(img_data) for img_data in imgs_data]
-
-    # Set cosmic ray pixels to NaN in all images and replace with the average of other images
-    imgs_data_nan = [
-        np.where(cosmic_masks[i], np.nan, imgs_data[i]) for i in range(len(imgs_data))
-    ]
+    # The images are streamed: each one is loaded, masked and added to the
+    # running sums, so only a few images are held in memory at a time.
+    filenames = [os.path.join(directory_path, filename) for filename in filenames]
+
+    # A single image has no other images to take replacement values from, so
+    # the cosmic ray pixels stay NaN
+    if len(filenames) == 1:
+        img_data = _load_image(filenames[0])
+        get_cosmic_mask(img_data)
+        return img_data.astype(np.float64)
+
+    total_sum = None
+    total_count = None
+
+    # Load the next images in the background while the cosmic rays of the
+    # current one are detected. Reading and decoding releases the GIL, and as
+    # the detection is slower than loading, a few prefetched images suffice.
+    with ThreadPoolExecutor(max_workers=_PREFETCH_DEPTH) as executor:
+        remaining = iter(filenames)
+        pending = deque(
+            executor.submit(_load_image, filename)
+            for filename in islice(remaining, _PREFETCH_DEPTH)
+        )
+        while pending:
+            img_data = pending.popleft().result()
+            filename = next(remaining, None)
+            if filename is not None:
+                pending.append(executor.submit(_load_image, filename))
+
+            cosmic_mask = get_cosmic_mask(img_data)
+            if total_sum is None:
+                total_sum = np.zeros(img_data.shape)
+                total_count = np.zeros(img_data.shape, dtype=np.int32)
+            _add_unmasked(total_sum, total_count, img_data, cosmic_mask)
 
     # Replace cosmic ray pixels with the average of other images
-    imgs_data = [
-        np.where(
-            cosmic_masks[i],
-            (
-                np.nanmean(
-                    [imgs_data_nan[j] for j in range(len(imgs_data)) if j != i], axis=0
-                )
-                if len(imgs_data) > 1
-                else imgs_data[i]
-            ),  # Use original value if only one image
-            imgs_data[i],
-        )
-        for i in range(len(imgs_data))
-    ]
+    return _sum_replacing_masked(total_sum, total_count, len(filenames))
 
-    return np.sum(imgs_data, axis=0)
+
+def _save_image(filename: str, data: np.ndarray) -> None:
+    """Save an image as float32 tiff file.
+
+    The images are summed in float64, the file stores float32 like PIL does for
+    float64 arrays.
+    """
+    Image.fromarray(data.astype(np.float32, copy=False)).save(filename)
+
+
+def _combine_images_collecting_log(
+    *args, use_gpu: bool = False
+) -> tuple[np.ndarray, list[str]]:
+    """Combine the images of a directory in a worker process.
+
+    The progress messages cannot be passed to the log function of the parent
+    process, so they are collected and returned with the combined image.
+    """
+    messages = []
+    combined_data = combine_images_in_directory(
+        *args, log=messages.append, use_gpu=use_gpu
+    )
+    return combined_data, messages
 
 
 def get_directory_groups(
@@ -116,6 +238,7 @@ def get_directory_groups(
     config: list,
     input_directory: str,
     directory_pattern: str = r"g(\d+)",
+    log=print,
 ) -> tuple[list, int]:
     """Group directories based on config and available directories, starting from start_idx.
 
@@ -132,6 +255,8 @@ def get_directory_groups(
         Regular expression pattern to match directory names. Must contain a capture group for the sequence number.
         Default is r"g(\\d+)" which matches directories like "g1", "g2", etc.
         Example for "project_1", "project_2": r"project_(\\d+)"
+    log : callable, optional
+        Function called with every progress message. Default is print.
 
     Returns
     -------
@@ -144,7 +269,7 @@ def get_directory_groups(
     current_index = start_idx
     pattern = re.compile(directory_pattern)
 
-    print(f"  Checking directories starting from index {current_index}")
+    log(f"  Checking directories starting from index {current_index}")
 
     # Validate configuration
     if not config:
@@ -158,35 +283,33 @@ def get_directory_groups(
         if not isinstance(num_directories, int):
             raise ValueError(f"Invalid configuration: number of directories for group '{group_name}' must be an integer, got {type(num_directories).__name__}")
 
+    # Index the matching directories by their sequence number once, keeping
+    # the first directory for every number
+    directories_by_index = {}
+    for directory_name in os.listdir(input_directory):
+        match = pattern.match(directory_name)
+        if match:
+            directories_by_index.setdefault(int(match.group(1)), directory_name)
+
     for group_name, num_directories in group_configs.items():
         group_directories = []
-        print(f"    Looking for {num_directories} directories for group '{group_name}'")
+        log(f"    Looking for {num_directories} directories for group '{group_name}'")
 
         for _ in range(num_directories):
-            # Find all directories that match the pattern
-            matching_directories = []
-            for directory_name in os.listdir(input_directory):
-                match = pattern.match(directory_name)
-                if match:
-                    directory_num = int(match.group(1))
-                    if directory_num == current_index:
-                        matching_directories.append(directory_name)
-
-            if matching_directories:
-                directory_name = matching_directories[0]  # Take the first matching directory
-                directory_path = os.path.join(input_directory, directory_name)
-                print(f"      Found directory: {directory_name}")
+            directory_name = directories_by_index.get(current_index)
+            if directory_name is not None:
+                log(f"      Found directory: {directory_name}")
                 group_directories.append(directory_name)
             else:
-                print(f"      No matching directory found for index {current_index}")
+                log(f"      No matching directory found for index {current_index}")
 
             current_index += 1
 
         if group_directories:
             groups.append({"name": group_name, "directories": group_directories})
-            print(f"    Added group '{group_name}' with {len(group_directories)} directories")
+            log(f"    Added group '{group_name}' with {len(group_directories)} directories")
         else:
-            print(f"    No directories found for group '{group_name}'")
+            log(f"    No directories found for group '{group_name}'")
 
     return groups, current_index
 
@@ -194,7 +317,7 @@ def get_directory_groups(
 def process_measurements(
     input_directory: str,
     output_directory: str,
-    config: str,
+    config: Union[str, list],
     start_index: int,
     end_index: int,
     cosmic_sigma: float,
@@ -203,6 +326,9 @@ def process_measurements(
     cosmic_min: float,
     prefix: str,
     callback=None,
+    log=print,
+    num_workers: int = 1,
+    use_gpu: bool = False,
 ) -> None:
     """Process all measurements and combine data according to groups.
 
@@ -212,10 +338,11 @@ def process_measurements(
         Path to the directory containing the input measurement data.
     output_directory : str
         Path where the combined output files will be saved.
-    config : str
-        JSON string containing the configuration for directory groups.
-        Each group should have a 'name' and 'num_directories' field.
-        Example: [{"num_directories": 2, "name": "center"}, {"num_directories": 2, "name": "side"}]
+    config : str or list
+        Configuration for the directory groups, either as parsed list or as
+        JSON string. The first object maps group names to their number of
+        directories.
+        Example: [{"center": 2, "side": 2}]
     start_index : int
         The starting index for processing directories.
     end_index : int
@@ -233,7 +360,24 @@ def process_measurements(
     callback : function, optional
         A callback function to check if the process should stop.
         Should return True to continue processing, False to stop.
+    log : callable, optional
+        Function called with every progress message. Default is print.
+    num_workers : int, optional
+        Number of worker processes which combine the directories of a group
+        concurrently (default: 1). With more than one worker, the worker
+        processes are spawned, so the caller's main module has to be guarded by
+        ``if __name__ == "__main__":``.
+    use_gpu : bool, optional
+        Detect the cosmic rays on the GPU. Requires CuPy, otherwise the
+        detection falls back to the CPU.
     """
+    if num_workers < 1:
+        raise ValueError(f"Number of workers must be at least 1, got {num_workers}")
+
+    if use_gpu and cupy is None:
+        log("CuPy is not installed, detecting cosmic rays on the CPU")
+        use_gpu = False
+
     # Check if input directory exists
     if not os.path.exists(input_directory):
         raise FileNotFoundError(f"Input directory not found: {input_directory}")
@@ -252,77 +396,140 @@ def process_measurements(
             f"No permission to create output directory: {output_directory}"
         )
 
-    # Parse the configuration
-    try:
-        config_data = json.loads(config)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Error parsing configuration JSON: {e}")
+    # Parse the configuration, unless it was passed already parsed
+    if isinstance(config, str):
+        try:
+            config_data = json.loads(config)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Error parsing configuration JSON: {e}")
+    else:
+        config_data = config
 
     current_index = start_index
     measurement_number = 1
 
-    while current_index <= end_index:
-        if callback and not callback():  # Check if we should stop
-            return
+    def should_stop():
+        return callback is not None and not callback()
 
-        print(
-            f"\nProcessing measurement {measurement_number} (starting from index {current_index})..."
-        )
-        groups, next_index = get_directory_groups(
-            current_index, config_data, input_directory
+    # With several workers the directories of a group are combined concurrently
+    # in worker processes, as the cosmic ray detection is CPU bound. The worker
+    # processes are spawned, since forking a process with running threads (Qt,
+    # Numba's threading layer) can deadlock.
+    pool_context = (
+        ProcessPoolExecutor(
+            max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")
         )
-
-        if not groups:  # If no valid groups were found, break the loop
-            raise ValueError(
-                f"No valid groups found starting from index {current_index}"
-            )
-
-        for group in groups:
-            if callback and not callback():  # Check if we should stop
-                return
-
-            print(f"  Processing {group['name']} measurements...")
-            combined_data = None
-
-            for directory_name in group["directories"]:
-                if callback and not callback():  # Check if we should stop
+        if num_workers > 1
+        else nullcontext()
+    )
+    # The combined images are written by a background thread, so that the
+    # next group is combined while the previous one is saved
+    pending_writes = []
+    try:
+        with pool_context as pool, ThreadPoolExecutor(max_workers=1) as writer:
+            while current_index <= end_index:
+                if should_stop():
                     return
 
-                directory_path = os.path.join(input_directory, directory_name)
-                if not os.path.exists(directory_path):
-                    raise FileNotFoundError(f"Directory not found: {directory_path}")
-
-                print(f"    Combining data from {directory_name}")
-                try:
-                    if combined_data is None:
-                        combined_data = combine_images_in_directory(
-                            directory_path,
-                            cosmic_sigma,
-                            cosmic_window,
-                            cosmic_iterations,
-                            cosmic_min,
-                        )
-                    else:
-                        new_data = combine_images_in_directory(
-                            directory_path,
-                            cosmic_sigma,
-                            cosmic_window,
-                            cosmic_iterations,
-                            cosmic_min,
-                        )
-                        combined_data += new_data
-
-                except Exception as e:
-                    print(f"    Error processing {directory_name}: {e}")
-                    continue
-
-            if combined_data is not None:
-                output_filename = os.path.join(
-                    output_directory,
-                    f"{prefix}_{group['name']}_{measurement_number:04d}.tif",
+                log(
+                    f"\nProcessing measurement {measurement_number} (starting from index {current_index})..."
+                )
+                groups, next_index = get_directory_groups(
+                    current_index, config_data, input_directory, log=log
                 )
-                Image.fromarray(combined_data).save(output_filename)
-                print(f"    Saved combined data to {output_filename}")
 
-        current_index = next_index
-        measurement_number += 1
+                if not groups:  # If no valid groups were found, break the loop
+                    raise ValueError(
+                        f"No valid groups found starting from index {current_index}"
+                    )
+
+                for group in groups:
+                    if should_stop():
+                        return
+
+                    log(f"  Processing {group['name']} measurements...")
+
+                    directory_paths = []
+                    for directory_name in group["directories"]:
+                        directory_path = os.path.join(input_directory, directory_name)
+                        if not os.path.exists(directory_path):
+                            raise FileNotFoundError(
+                                f"Directory not found: {directory_path}"
+                            )
+                        directory_paths.append(directory_path)
+
+                    cosmic_args = (
+                        cosmic_sigma,
+                        cosmic_window,
+                        cosmic_iterations,
+                        cosmic_min,
+                    )
+                    futures = (
+                        [
+                            pool.submit(
+                                _combine_images_collecting_log,
+                                path,
+                                *cosmic_args,
+                                use_gpu=use_gpu,
+                            )
+                            for path in directory_paths
+                        ]
+                        if pool is not None
+                        else []
+                    )
+
+                    # The results are added in the order of the directories, which
+                    # keeps the log and the sum independent of the scheduling
+                    combined_data = None
+                    for i, directory_name in enumerate(group["directories"]):
+                        if should_stop():
+                            for future in futures:
+                                future.cancel()
+                            return
+
+                        log(f"    Combining data from {directory_name}")
+                        try:
+                            if pool is None:
+                                new_data = combine_images_in_directory(
+                                    directory_paths[i],
+                                    *cosmic_args,
+                                    log=log,
+                                    use_gpu=use_gpu,
+                                )
+                            else:
+                                while not futures[i].done():
+                                    if should_stop():
+                                        for future in futures:
+                                            future.cancel()
+                                        return
+                                    wait([futures[i]], timeout=_STOP_POLL_INTERVAL)
+                                new_data, messages = futures[i].result()
+                                for message in messages:
+                                    log(message)
+                        except Exception as e:
+                            log(f"    Error processing {directory_name}: {e}")
+                            continue
+
+                        if combined_data is None:
+                            combined_data = new_data
+                        else:
+                            combined_data += new_data
+
+                    if combined_data is not None:
+                        output_filename = os.path.join(
+                            output_directory,
+                            f"{prefix}_{group['name']}_{measurement_number:04d}.tif",
+                        )
+                        pending_writes.append(
+                            writer.submit(_save_image, output_filename, combined_data)
+                        )
+                        log(f"    Writing combined data to {output_filename}")
+
+                current_index = next_index
+                measurement_number += 1
+    finally:
+        # Raise any error which occurred while writing the output files, also
+        # when the processing was stopped or failed. The writer has finished
+        # all writes when its executor was shut down.
+        for future in pending_writes:
+            future.result()
@@ -11,20 +11,30 @@ from PyQt6.QtWidgets import (
     QPushButton,
     QSpinBox,
     QDoubleSpinBox,
+    QComboBox,
     QFileDialog,
-    QTextEdit,
+    QPlainTextEdit,
     QGroupBox,
     QFormLayout,
     QTableWidget,
     QTableWidgetItem,
     QHeaderView,
 )
-from PyQt6.QtCore import QThread, pyqtSignal
+from PyQt6.QtCore import QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QTextCharFormat, QTextCursor
 from . import process_measurements
+from ..gui_worker import ProgressWorker
 from datetime import datetime
 
+# Number of lines kept in the log, older lines are dropped
+_MAX_LOG_LINES = 5000
 
-class ConversionWorker(QThread):
+# Delay in milliseconds after the last change of a setting before the state is
+# saved, so that typing or scrolling through values writes the file only once
+_SAVE_STATE_DELAY = 500
+
+
+class ConversionWorker(ProgressWorker):
     """Worker thread for running the conversion process.
     
     This class handles the background processing of image combination tasks,
@@ -41,12 +51,12 @@ class ConversionWorker(QThread):
         Emitted when an error occurs during processing.
     """
 
-    progress = pyqtSignal(str)
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
     def __init__(self, input_directory, output_directory, config, start_index, end_index,
-                 cosmic_sigma, cosmic_window, cosmic_iterations, cosmic_min, prefix):
+                 cosmic_sigma, cosmic_window, cosmic_iterations, cosmic_min, prefix,
+                 num_workers=1, use_gpu=False):
         """Initialize the worker thread.
         
         Parameters
@@ -55,8 +65,9 @@ class ConversionWorker(QThread):
             Path to the directory containing input images.
         output_directory : str
             Path where combined images will be saved.
-        config : str
-            JSON string containing the configuration for directory groups.
+        config : list
+            Configuration for the directory groups, the first object maps the
+            group names to their number of directories.
         start_index : int
             Starting index for processing directories.
         end_index : int
@@ -71,6 +82,11 @@ class ConversionWorker(QThread):
             Minimum intensity threshold for cosmic ray detection.
         prefix : str
             Prefix for output filenames.
+        num_workers : int, optional
+            Number of processes which combine the directories of a group
+            concurrently.
+        use_gpu : bool, optional
+            Detect the cosmic rays on the GPU. Requires CuPy.
         """
         super().__init__()
         self.input_directory = input_directory
@@ -83,61 +99,42 @@ class ConversionWorker(QThread):
         self.cosmic_iterations = cosmic_iterations
         self.cosmic_min = cosmic_min
         self.prefix = prefix
-        self._is_running = True
-        self._original_print = print
-
-    def stop(self):
-        """Stop the processing thread."""
-        self._is_running = False
-
-    def should_continue(self):
-        """Check if processing should continue.
-        
-        Returns
-        -------
-        bool
-            True if processing should continue, False if it should stop.
-        """
-        return self._is_running
+        self.num_workers = num_workers
+        self.use_gpu = use_gpu
 
     def run(self):
         """Run the image combination process.
         
         This method:
-        1. Sets up custom print function to capture output
-        2. Processes the images using process_measurements
-        3. Handles errors and emits appropriate signals
-        4. Restores the original print function
+        1. Processes the images using process_measurements, which sends its
+           progress messages in batches through _queue_progress
+        2. Handles errors and emits appropriate signals
         """
-        # Override print to capture output
-        def custom_print(*args, **kwargs):
-            if not self._is_running:
-                return
-            self.progress.emit(" ".join(map(str, args)))
-
-        # Store original print function and replace it
-        import builtins
-
-        builtins.print = custom_print
-
         try:
             # Check if we should stop before starting
             if not self._is_running:
                 return
 
-            process_measurements(
-                input_directory=self.input_directory,
-                output_directory=self.output_directory,
-                config=self.config,
-                start_index=self.start_index,
-                end_index=self.end_index,
-                cosmic_sigma=self.cosmic_sigma,
-                cosmic_window=self.cosmic_window,
-                cosmic_iterations=self.cosmic_iterations,
-                cosmic_min=self.cosmic_min,
-                prefix=self.prefix,
-                callback=self.should_continue
-            )
+            try:
+                process_measurements(
+                    input_directory=self.input_directory,
+                    output_directory=self.output_directory,
+                    config=self.config,
+                    start_index=self.start_index,
+                    end_index=self.end_index,
+                    cosmic_sigma=self.cosmic_sigma,
+                    cosmic_window=self.cosmic_window,
+                    cosmic_iterations=self.cosmic_iterations,
+                    cosmic_min=self.cosmic_min,
+                    prefix=self.prefix,
+                    callback=self.should_continue,
+                    log=self._queue_progress,
+                    num_workers=self.num_workers,
+                    use_gpu=self.use_gpu,
+                )
+            finally:
+                # Send the remaining messages before the result or the error
+                self._flush_progress()
 
             # Only emit finished if we completed normally (not stopped)
             if self._is_running:
@@ -150,9 +147,6 @@ class ConversionWorker(QThread):
         except Exception as e:
             if self._is_running:  # Only emit error if we're not stopping
                 self.error.emit(f"Error: An unexpected error occurred - {str(e)}")
-        finally:
-            # Restore original print function
-            builtins.print = self._original_print
 
 
 class MainWindow(QMainWindow):
@@ -234,6 +228,15 @@ class MainWindow(QMainWindow):
         self.end_idx.setValue(97)
         file_layout.addRow("End Index:", self.end_idx)
 
+        self.num_workers = QSpinBox()
+        self.num_workers.setRange(1, os.cpu_count() or 1)
+        self.num_workers.setValue(1)
+        self.num_workers.setToolTip(
+            "Number of processes which combine the directories of a measurement "
+            "concurrently"
+        )
+        file_layout.addRow("Worker Processes:", self.num_workers)
+
         file_group.setLayout(file_layout)
         left_layout.addWidget(file_group)
 
@@ -264,6 +267,13 @@ class MainWindow(QMainWindow):
         self.cosmic_min.setSingleStep(10.0)
         cosmic_layout.addRow("Minimum Intensity:", self.cosmic_min)
 
+        self.cosmic_device = QComboBox()
+        self.cosmic_device.addItems(["CPU", "CUDA"])
+        self.cosmic_device.setToolTip(
+            "Detect the cosmic rays on the GPU with CUDA, requires CuPy"
+        )
+        cosmic_layout.addRow("Device:", self.cosmic_device)
+
         cosmic_group.setLayout(cosmic_layout)
         left_layout.addWidget(cosmic_group)
 
@@ -278,6 +288,14 @@ class MainWindow(QMainWindow):
         self.config_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         config_layout.addWidget(self.config_table)
 
+        # The configuration JSON is cached until the table model changes
+        self._config_json = None
+        model = self.config_table.model()
+        model.dataChanged.connect(self.invalidate_config_cache)
+        model.rowsInserted.connect(self.invalidate_config_cache)
+        model.rowsRemoved.connect(self.invalidate_config_cache)
+        model.modelReset.connect(self.invalidate_config_cache)
+
         # Buttons for adding/removing rows
         config_buttons = QHBoxLayout()
         add_row = QPushButton("Add Measurement")
@@ -367,8 +385,10 @@ class MainWindow(QMainWindow):
         log_group = QGroupBox("Output Log")
         log_layout = QVBoxLayout()
 
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(_MAX_LOG_LINES)
+        self._log_cursor = QTextCursor(self.log_output.document())
         log_layout.addWidget(self.log_output)
 
         # Add clear button below log
@@ -412,6 +432,29 @@ class MainWindow(QMainWindow):
         # Load saved state
         self.load_state()
 
+        # Save the state shortly after the settings were changed, so that it
+        # is not lost if the application does not close normally
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(_SAVE_STATE_DELAY)
+        self._save_timer.timeout.connect(self.save_state)
+        for signal in (
+            self.input_dir.textChanged,
+            self.output_dir.textChanged,
+            self.prefix.textChanged,
+            self.start_idx.valueChanged,
+            self.end_idx.valueChanged,
+            self.num_workers.valueChanged,
+            self.cosmic_sigma.valueChanged,
+            self.cosmic_window.valueChanged,
+            self.cosmic_iterations.valueChanged,
+            self.cosmic_min.valueChanged,
+            self.cosmic_device.currentIndexChanged,
+            self.config_table.itemChanged,
+            self.config_table.model().rowsRemoved,
+        ):
+            signal.connect(self.schedule_save_state)
+
     def get_state_file_path(self):
         """Get the path to the state file.
         
@@ -429,25 +472,33 @@ class MainWindow(QMainWindow):
         
         return os.path.join(config_dir, "combined_data_gui_state.json")
 
+    def invalidate_config_cache(self, *args):
+        """Clear the cached configuration after a change of the table."""
+        self._config_json = None
+
     def get_config_json(self):
         """Get the configuration as a JSON string.
+
+        The result is cached until the table changes.
         
         Returns
         -------
         str
             JSON string containing the configuration.
         """
-        config = {}
-        for row in range(self.config_table.rowCount()):
-            name_item = self.config_table.item(row, 0)
-            num_dirs_item = self.config_table.item(row, 1)
-            if name_item and num_dirs_item:
-                try:
-                    num_dirs = int(num_dirs_item.text())
-                    config[name_item.text()] = num_dirs
-                except ValueError:
-                    pass
-        return json.dumps([config])
+        if self._config_json is None:
+            config = {}
+            for row in range(self.config_table.rowCount()):
+                name_item = self.config_table.item(row, 0)
+                num_dirs_item = self.config_table.item(row, 1)
+                if name_item and num_dirs_item:
+                    try:
+                        num_dirs = int(num_dirs_item.text())
+                        config[name_item.text()] = num_dirs
+                    except ValueError:
+                        pass
+            self._config_json = json.dumps([config])
+        return self._config_json
 
     def save_state(self):
         """Save the current state of the application."""
@@ -457,15 +508,33 @@ class MainWindow(QMainWindow):
             "prefix": self.prefix.text(),
             "start_index": self.start_idx.value(),
             "end_index": self.end_idx.value(),
+            "num_workers": self.num_workers.value(),
             "cosmic_sigma": self.cosmic_sigma.value(),
             "cosmic_window": self.cosmic_window.value(),
             "cosmic_iterations": self.cosmic_iterations.value(),
             "cosmic_min": self.cosmic_min.value(),
+            "cosmic_device": self.cosmic_device.currentText(),
             "config": self.get_config_json()
         }
         
-        with open(self.get_state_file_path(), "w") as f:
-            json.dump(state, f)
+        # Write to a temporary file first and replace the state file with it,
+        # so an interrupted write cannot leave a truncated state file
+        state_file = self.get_state_file_path()
+        temp_file = state_file + ".tmp"
+        try:
+            with open(temp_file, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_file, state_file)
+        except OSError as e:
+            self.append_log(f"Error saving state: {str(e)}", color="red")
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+    def schedule_save_state(self, *args):
+        """Save the state after the settings have not changed for a moment."""
+        self._save_timer.start()
 
     def load_state(self):
         """Load the saved state of the application."""
@@ -478,10 +547,12 @@ class MainWindow(QMainWindow):
             self.prefix.setText(state.get("prefix", ""))
             self.start_idx.setValue(state.get("start_index", 2))
             self.end_idx.setValue(state.get("end_index", 97))
+            self.num_workers.setValue(state.get("num_workers", 1))
             self.cosmic_sigma.setValue(state.get("cosmic_sigma", 6.0))
             self.cosmic_window.setValue(state.get("cosmic_window", 10))
             self.cosmic_iterations.setValue(state.get("cosmic_iterations", 3))
             self.cosmic_min.setValue(state.get("cosmic_min", 50.0))
+            self.cosmic_device.setCurrentText(state.get("cosmic_device", "CPU"))
             
             # Load configuration
             config = json.loads(state.get("config", '[{"center": 2, "side": 2}]'))[0]
@@ -503,6 +574,7 @@ class MainWindow(QMainWindow):
         event : QCloseEvent
             The close event.
         """
+        self._save_timer.stop()
         self.save_state()
         super().closeEvent(event)
 
@@ -532,9 +604,35 @@ class MainWindow(QMainWindow):
             The message to add to the log.
         """
         if message.startswith("Error:"):
-            self.log_output.append(f'<span style="color: red;">{message}</span>')
+            self.append_log(message, color="red")
         else:
-            self.log_output.append(message)
+            self.log_output.appendPlainText(message)
+
+    def append_log(self, message, color=None, bold=False):
+        """Append a line to the log with the given color and weight.
+
+        Parameters
+        ----------
+        message : str
+            The message to add to the log.
+        color : str, optional
+            Name of the text color, by default the color is not changed.
+        bold : bool, optional
+            Whether the text is bold.
+        """
+        self.log_output.appendPlainText(message)
+        char_format = QTextCharFormat()
+        if color is not None:
+            char_format.setForeground(QColor(color))
+        if bold:
+            char_format.setFontWeight(QFont.Weight.Bold)
+
+        # Select the appended line and apply the format to it
+        self._log_cursor.movePosition(QTextCursor.MoveOperation.End)
+        self._log_cursor.movePosition(
+            QTextCursor.MoveOperation.StartOfBlock, QTextCursor.MoveMode.KeepAnchor
+        )
+        self._log_cursor.setCharFormat(char_format)
 
     def add_config_row(self):
         """Add a new row to the configuration table."""
@@ -579,14 +677,16 @@ class MainWindow(QMainWindow):
         self.worker = ConversionWorker(
             input_directory=input_dir,
             output_directory=self.output_dir.text(),
-            config=json.dumps([config]),
+            config=[config],
             start_index=self.start_idx.value(),
             end_index=self.end_idx.value(),
             cosmic_sigma=self.cosmic_sigma.value(),
             cosmic_window=self.cosmic_window.value(),
             cosmic_iterations=self.cosmic_iterations.value(),
             cosmic_min=self.cosmic_min.value(),
-            prefix=self.prefix.text()
+            prefix=self.prefix.text(),
+            num_workers=self.num_workers.value(),
+            use_gpu=self.cosmic_device.currentText() == "CUDA",
         )
 
         # Connect signals
@@ -614,16 +714,12 @@ class MainWindow(QMainWindow):
         """Stop the current conversion process."""
         if self.worker is not None:
             self.worker.stop()
-            self.log_output.append("")  # Add empty line before stop message
-            self.log_output.append("=" * 40)
-            self.log_output.append(
-                '<span style="color: red; font-weight: bold;">■ Conversion stopped by user</span>'
-            )
-            self.log_output.append(
-                f'<span style="color: gray;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</span>'
-            )
-            self.log_output.append("=" * 40)
-            self.log_output.append("")  # Add empty line after stop message
+            self.log_output.appendPlainText("")  # Add empty line before stop message
+            self.log_output.appendPlainText("=" * 40)
+            self.append_log("■ Conversion stopped by user", color="red", bold=True)
+            self.append_log(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), color="gray")
+            self.log_output.appendPlainText("=" * 40)
+            self.log_output.appendPlainText("")  # Add empty line after stop message
             self.start_button.setEnabled(True)
             self.stop_button.setEnabled(False)
 
@@ -631,16 +727,12 @@ class MainWindow(QMainWindow):
         """Handle completion of the conversion process."""
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
-        self.log_output.append("")  # Add empty line before completion message
-        self.log_output.append("=" * 40)
-        self.log_output.append(
-            '<span style="color: green; font-weight: bold;">✓ Conversion completed successfully</span>'
-        )
-        self.log_output.append(
-            f'<span style="color: gray;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</span>'
-        )
-        self.log_output.append("=" * 40)
-        self.log_output.append("")  # Add empty line after completion message
+        self.log_output.appendPlainText("")  # Add empty line before completion message
+        self.log_output.appendPlainText("=" * 40)
+        self.append_log("✓ Conversion completed successfully", color="green", bold=True)
+        self.append_log(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), color="gray")
+        self.log_output.appendPlainText("=" * 40)
+        self.log_output.appendPlainText("")  # Add empty line after completion message
 
     def clear_log(self):
         """Clear the log display."""
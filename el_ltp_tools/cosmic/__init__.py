@@ -1,12 +1,141 @@
+from typing import Optional
+
 import numpy as np
 from scipy import ndimage
 
+try:
+    import cupy
+    import cupyx.scipy.ndimage
+except ImportError:  # CuPy is optional and only needed for GPU cosmic ray detection
+    cupy = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional and only speeds up the cosmic ray detection
+    njit = None
+
+# Number of pixels of a strip detect_cosmic_rays_multiple_iterations processes
+# at once, small enough for the strip and its statistics to stay in the cache
+_STRIP_PIXELS = 1 << 19
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _reflected_window_indices(size, window_size):
+        """Reflected indices of the running windows along one axis.
+
+        The window of position i spans indices[i:i + window_size], following the
+        window placement and the "reflect" mode of scipy.ndimage.uniform_filter.
+        """
+        before = window_size // 2
+        period = 2 * size
+        indices = np.empty(size + window_size - 1, dtype=np.int64)
+        for i in range(indices.shape[0]):
+            index = (i - before) % period
+            indices[i] = index if index < size else period - 1 - index
+        return indices
+
+    @njit(cache=True)
+    def _add_row_window_sums(data, y, cols, x0, window_size, sign, sums):
+        """Add the running window sums along row y to the sums of a column block.
+
+        sums holds the sum, count and sum of squares of the columns starting at
+        x0. The row sums are multiplied by sign, which adds a row entering the
+        vertical window or removes a row leaving it.
+        """
+        total = 0.0
+        count = 0.0
+        squares = 0.0
+        for i in range(x0, x0 + window_size - 1):
+            value = np.float64(data[y, cols[i]])
+            if value > 0:
+                total += value
+                count += 1.0
+                squares += value * value
+        for x in range(x0, x0 + sums.shape[1]):
+            value = np.float64(data[y, cols[x + window_size - 1]])
+            if value > 0:
+                total += value
+                count += 1.0
+                squares += value * value
+            sums[0, x - x0] += sign * total
+            sums[1, x - x0] += sign * count
+            sums[2, x - x0] += sign * squares
+            value = np.float64(data[y, cols[x]])
+            if value > 0:
+                total -= value
+                count -= 1.0
+                squares -= value * value
+
+    @njit(parallel=True, cache=True)
+    def _window_sums_kernel(
+        data, window_size, sum_positive, count_positive, sum_squares
+    ):
+        """Windowed sum, count and sum of squares of the positive pixels.
+
+        One separable running-sum pass computes all three statistics, instead of
+        one uniform_filter call each. The results are sums, not means, which
+        leaves their ratios used by the detection unchanged. The sums are
+        accumulated in float64 like the ndimage path.
+        """
+        height, width = data.shape
+        rows = _reflected_window_indices(height, window_size)
+        cols = _reflected_window_indices(width, window_size)
+
+        # Vertical running sums over blocks of columns. The row sums entering
+        # and leaving the window are computed where they are needed instead
+        # of in full-image temporaries.
+        block = 64
+        for start in prange((width + block - 1) // block):
+            x0 = start * block
+            sums = np.zeros((3, min(block, width - x0)))
+            for i in range(window_size - 1):
+                _add_row_window_sums(data, rows[i], cols, x0, window_size, 1.0, sums)
+            for y in range(height):
+                _add_row_window_sums(
+                    data, rows[y + window_size - 1], cols, x0, window_size, 1.0, sums
+                )
+                for x in range(sums.shape[1]):
+                    sum_positive[y, x0 + x] = sums[0, x]
+                    count_positive[y, x0 + x] = sums[1, x]
+                    sum_squares[y, x0 + x] = sums[2, x]
+                _add_row_window_sums(data, rows[y], cols, x0, window_size, -1.0, sums)
+
+    @njit(parallel=True, cache=True)
+    def _cosmic_mask_kernel(
+        data, sum_positive, count_positive, sum_squares, sigma, min_intensity, out
+    ):
+        """Fused per-pixel statistics of detect_cosmic_rays.
+
+        Computes the local mean, standard deviation and z-score of every pixel
+        in a single pass instead of a full-image temporary for every step.
+        """
+        height, width = data.shape
+        for y in prange(height):
+            for x in range(width):
+                value = np.float64(data[y, x])
+                count = count_positive[y, x]
+                # NaN compares False, so NaN pixels are never cosmic rays
+                if not (value > 0 and value > min_intensity):
+                    out[y, x] = False
+                    continue
+                mean = 0.0
+                std = 0.0
+                if count > 0:
+                    mean = sum_positive[y, x] / count
+                    std = np.sqrt(max(sum_squares[y, x] / count - mean * mean, 0.0))
+                z_score = (value - mean) / (std + 1e-10) if std > 0 else 0.0
+                out[y, x] = z_score > sigma or value > 2 * mean
+
 
 def detect_cosmic_rays(
     data: np.ndarray,
     sigma: float,
     window_size: int,
     min_intensity: float,
+    use_gpu: bool = False,
+    buffers: Optional[tuple] = None,
 ) -> np.ndarray:
     """Detect cosmic rays in image data by comparing pixel values to local statistics.
 
@@ -27,55 +156,100 @@ def detect_cosmic_rays(
     min_intensity : float
         Minimum pixel intensity threshold. Only pixels above this value will be
         considered as potential cosmic rays.
+    use_gpu : bool, optional
+        Compute the detection on the GPU. Requires CuPy.
+    buffers : tuple of numpy.ndarray, optional
+        Three float64 arrays of the shape of `data` that receive the local sums,
+        counts and sums of squares, so repeated calls reuse the same memory.
+        Ignored on the GPU.
 
     Returns
     -------
     numpy.ndarray
         Boolean mask where True indicates pixels identified as cosmic rays.
     """
+    if njit is not None and not use_gpu:
+        if buffers is None:
+            buffers = tuple(np.empty(data.shape) for _ in range(3))
+        sum_positive, count_positive, sum_squares = buffers
+        _window_sums_kernel(
+            data, window_size, sum_positive, count_positive, sum_squares
+        )
+        combined_mask = np.empty(data.shape, dtype=bool)
+        _cosmic_mask_kernel(
+            data,
+            sum_positive,
+            count_positive,
+            sum_squares,
+            sigma,
+            min_intensity,
+            combined_mask,
+        )
+        return combined_mask
+
+    # The same array operations run on the GPU with CuPy
+    if use_gpu:
+        xp, filters = cupy, cupyx.scipy.ndimage
+        data = cupy.asarray(data)
+    else:
+        xp, filters = np, ndimage
+
     # Create a mask for positive values
     positive_mask = data > 0
 
-    # Create a copy of data where negative values are set to 0
-    data_positive = np.where(positive_mask, data, 0)
+    # Create a copy of data where negative values are set to 0. The statistics
+    # are computed in float64, in float32 the variance of high-count pixels is
+    # lost to the cancellation in sum_squares / count - mean**2.
+    data_positive = xp.where(positive_mask, data, 0).astype(np.float64, copy=False)
 
     # Calculate local mean and standard deviation using only positive values
     # First, calculate the sum and count of positive values in each window
-    sum_positive = ndimage.uniform_filter(data_positive, size=window_size)
-    count_positive = ndimage.uniform_filter(
-        positive_mask.astype(float), size=window_size
-    )
-
-    # Calculate mean (avoiding division by zero)
-    local_mean = np.where(count_positive > 0, sum_positive / count_positive, 0)
+    if buffers is None or use_gpu:
+        sum_positive = filters.uniform_filter(data_positive, size=window_size)
+        count_positive = filters.uniform_filter(
+            positive_mask.astype(np.float64), size=window_size
+        )
 
-    # Calculate variance for positive values
-    sum_squares = ndimage.uniform_filter(data_positive**2, size=window_size)
-    local_var = np.where(
-        count_positive > 0, (sum_squares / count_positive) - local_mean**2, 0
-    )
+        # Calculate the sum of squares for the variance of positive values
+        sum_squares = filters.uniform_filter(data_positive**2, size=window_size)
+    else:
+        sum_positive, count_positive, sum_squares = buffers
+        filters.uniform_filter(data_positive, size=window_size, output=sum_positive)
+        # The squares buffer holds the positive mask and then the squares
+        # until it receives its own filter output
+        np.copyto(sum_squares, positive_mask)
+        filters.uniform_filter(sum_squares, size=window_size, output=count_positive)
+        np.square(data_positive, out=data_positive)
+        filters.uniform_filter(data_positive, size=window_size, output=sum_squares)
 
-    local_std = np.sqrt(np.maximum(local_var, 0))
+    # The statistics are computed in place in the filter outputs, which are
+    # not needed afterwards, instead of a new full-image array for every step.
+    # Windows without positive pixels get a mean and variance of 0.
+    count_positive[count_positive <= 0] = 1
+    local_mean = xp.divide(sum_positive, count_positive, out=sum_positive)
+    local_var = xp.divide(sum_squares, count_positive, out=sum_squares)
+    local_var -= xp.multiply(local_mean, local_mean, out=count_positive)
+    local_std = xp.sqrt(xp.maximum(local_var, 0, out=local_var), out=local_var)
 
-    # Calculate z-scores only for positive values
-    z_scores = np.zeros_like(data)
-    valid_mask = np.logical_and(positive_mask, local_std > 0)
-    z_scores[valid_mask] = (data[valid_mask] - local_mean[valid_mask]) / (
-        local_std[valid_mask] + 1e-10
-    )
-
-    # Create mask for cosmic rays (pixels that are significantly above local mean)
-    cosmic_mask = np.logical_and(z_scores > sigma, positive_mask)
+    # Create mask for cosmic rays (pixels that are significantly above local mean),
+    # z-scores are only considered where the local standard deviation is positive.
+    # Instead of dividing by the standard deviation, the threshold is scaled.
+    valid_mask = local_std > 0
+    local_std += 1e-10
+    local_std *= sigma
+    combined_mask = (data - local_mean) > local_std
+    combined_mask &= valid_mask
 
     # Also mask pixels that are more than 2x the local mean
-    intensity_mask = np.logical_and(data > (2 * local_mean), positive_mask)
-
-    # Combine masks
-    combined_mask = np.logical_or(cosmic_mask, intensity_mask)
+    local_mean *= 2
+    combined_mask |= data > local_mean
 
-    # Apply minimum intensity threshold
-    combined_mask = np.logical_and(combined_mask, data > min_intensity)
+    # Only positive pixels above the minimum intensity are cosmic rays
+    combined_mask &= positive_mask
+    combined_mask &= data > min_intensity
 
+    if use_gpu:
+        return cupy.asnumpy(combined_mask)
     return combined_mask
 
 
@@ -85,6 +259,7 @@ def detect_cosmic_rays_multiple_iterations(
     window_size: int,
     iterations: int,
     min_intensity: float,
+    log=print,
 ) -> np.ndarray:
     """Apply cosmic ray detection and removal through multiple iterations.
 
@@ -107,34 +282,61 @@ def detect_cosmic_rays_multiple_iterations(
     min_intensity : float
         Minimum pixel intensity threshold for cosmic ray detection. Values below this
         threshold are not considered as cosmic rays.
+    log : callable, optional
+        Function called with the cosmic ray counts of the iterations. Default is
+        print.
 
     Returns
     -------
     numpy.ndarray
         Combined boolean mask of all detected cosmic rays across iterations
     """
-    # Convert to float before any operations, make a copy
-    image = image.astype(np.float64).copy()
+    height, width = image.shape
+
+    # All iterations are applied to one horizontal strip of the image after the
+    # other, so that the strip stays in the cache instead of streaming the
+    # whole image from memory in every pass. Every iteration can only change
+    # the statistics of pixels half a window further, so with that many extra
+    # rows above and below the core rows of a strip these are detected exactly
+    # as in the whole image.
+    halo = iterations * (window_size // 2)
+    strip_height = min(height, max(window_size, _STRIP_PIXELS // max(width, 1)))
+    max_rows = min(height, strip_height + 2 * halo)
+
+    # Reuse the strip copy and the filter outputs for all strips and iterations
+    strip_buffer = np.empty((max_rows, width), dtype=np.float32)
+    buffers = tuple(np.empty(strip_buffer.shape) for _ in range(3))
 
     # Store counts for each iteration
-    cosmic_counts = []
+    cosmic_counts = [0] * iterations
 
     # Initialize combined mask
-    combined_mask = np.zeros_like(image, dtype=bool)
+    combined_mask = np.zeros(image.shape, dtype=bool)
+
+    for core_start in range(0, height, strip_height):
+        core_stop = min(core_start + strip_height, height)
+        start = max(core_start - halo, 0)
+        stop = min(core_stop + halo, height)
+        core = slice(core_start - start, core_stop - start)
 
-    # Iterate multiple times to catch all cosmic rays
-    for i in range(iterations):
-        # Detect cosmic rays
-        cosmic_mask = detect_cosmic_rays(image, sigma, window_size, min_intensity)
-        image[cosmic_mask] = np.nan
+        # Convert to float32 before any operations, this also makes a copy
+        strip = strip_buffer[: stop - start]
+        np.copyto(strip, image[start:stop])
+        strip_buffers = tuple(buffer[: stop - start] for buffer in buffers)
 
-        # Update combined mask
-        combined_mask = np.logical_or(combined_mask, cosmic_mask)
+        # Iterate multiple times to catch all cosmic rays
+        for i in range(iterations):
+            # Detect cosmic rays
+            cosmic_mask = detect_cosmic_rays(
+                strip, sigma, window_size, min_intensity, buffers=strip_buffers
+            )
+            strip[cosmic_mask] = np.nan
 
-        # Store the count
-        cosmic_counts.append(np.sum(cosmic_mask))
+            # Update combined mask and count with the core rows of the strip
+            combined_mask[core_start:core_stop] |= cosmic_mask[core]
+            cosmic_counts[i] += int(np.count_nonzero(cosmic_mask[core]))
 
     # Print all counts in one line
-    print(f"        Found cosmic rays: {', '.join(map(str, cosmic_counts))}")
+    log(f"        Found cosmic rays: {', '.join(map(str, cosmic_counts))}")
 
     return combined_mask
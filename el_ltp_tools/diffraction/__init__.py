@@ -1,11 +1,37 @@
 from pyFAI.multi_geometry import MultiGeometry
+from pyFAI.method_registry import IntegrationMethod
 import fabio
 import numpy as np
-from PIL import Image
-import glob
+from scipy import sparse
 import re
 import os
-from typing import TypedDict, Dict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+from typing import TypedDict, Dict, Optional
+
+try:
+    import cupy
+    import cupyx.scipy.sparse
+except ImportError:  # CuPy is optional and only needed for GPU integration
+    cupy = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional and only speeds up the batched integration
+    njit = None
+
+
+# Matches the frame index at the end of an image filename
+_INDEX_PATTERN = re.compile(r"(\d+)\.tiff?$")
+
+# Matches the configuration name, frame index and extension of an image
+# filename, removing it leaves the base name of the measurement
+_BASE_NAME_PATTERN = re.compile(r"_[^_]+_\d+\.tiff?$")
+
+# pyFAI integration method, pinned to CSR so that the look-up tables are built
+# once and reused for every frame (also by the batched integration)
+_CSR_METHOD = IntegrationMethod.select_one_available(("full", "csr", "cython"), dim=1)
 
 
 class DetectorConfig(TypedDict):
@@ -37,20 +63,241 @@ def get_sorted_files(base_path: str, keyword: str) -> list[str]:
     list[str]
         List of sorted file paths matching the pattern.
     """
-    pattern_tif = f"{base_path}/*{keyword}*.tif"
-    pattern_tiff = f"{base_path}/*{keyword}*.tiff"
-    files = glob.glob(pattern_tif) + glob.glob(pattern_tiff)
+    # Filter the directory entries directly instead of using glob, which
+    # would translate the pattern and match every entry twice
+    with os.scandir(base_path) as entries:
+        files = [
+            entry.path
+            for entry in entries
+            if keyword in entry.name
+            and entry.name.endswith((".tif", ".tiff"))
+            and not entry.name.startswith(".")
+        ]
 
     # Extract number from filename and sort
     def get_index(filename):
-        match = re.search(r"(\d+)\.tiff?$", filename)
+        match = _INDEX_PATTERN.search(filename)
         return int(match.group(1)) if match else 0
 
     return sorted(files, key=get_index)
 
 
+def _load_image(filename: str, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Load an image and flip it vertically to match the pyFAI orientation.
+
+    The flipped image is returned as a contiguous float32 copy, which is the
+    format pyFAI integrates in. This way the copy and the conversion are done
+    in the loader thread instead of inside every integration.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the image file.
+    out : np.ndarray, optional
+        Preallocated float32 array with the shape of the image the flipped
+        image is written to. If not given, a new array is allocated.
+
+    Returns
+    -------
+    np.ndarray
+        The flipped image (``out`` if it was given).
+    """
+    data = fabio.open(filename).data[::-1]
+    if out is None:
+        return np.ascontiguousarray(data, dtype=np.float32)
+    np.copyto(out, data)
+    return out
+
+
+def _load_mask(filename: str) -> np.ndarray:
+    """Load a mask file as a contiguous int8 array (non-zero pixels are masked).
+
+    This is the representation pyFAI uses internally, so the mask does not
+    need to be converted again for every integrated frame.
+    """
+    return np.ascontiguousarray(fabio.open(filename).data != 0, dtype=np.int8)
+
+
+def _save_pattern(filename: str, q: np.ndarray, I: np.ndarray) -> None:
+    """Save an integrated pattern as a two-column .xy file.
+
+    The output is identical to ``np.savetxt`` with its default format, but all
+    rows are formatted with a single string operation instead of one per row.
+    """
+    # Interleave q and I as Python floats, without building a (npt, 2) array
+    values = tuple(chain.from_iterable(zip(q.tolist(), I.tolist())))
+    with open(filename, "w") as f:
+        f.write("# q(A^-1) I(a.u.)\n")
+        f.write(("%.18e %.18e\n" * len(q)) % values)
+
+
+def _create_h5_output(filename: str, q: np.ndarray, names: list[str]):
+    """Create an HDF5 file for all integrated patterns of a measurement.
+
+    The file contains the radial axis ``q``, the pattern ``name`` of every
+    frame and an ``I`` dataset with one chunked, compressed row per frame,
+    which is filled while the frames are integrated.
+
+    Returns
+    -------
+    h5py.File
+        The opened HDF5 file.
+    """
+    # h5py is optional and only needed for the HDF5 output
+    import h5py
+
+    h5_file = h5py.File(filename, "w")
+    h5_file.create_dataset("q", data=q)
+    h5_file.create_dataset("name", data=names, dtype=h5py.string_dtype())
+    h5_file.create_dataset(
+        "I",
+        shape=(len(names), len(q)),
+        dtype=np.float32,
+        chunks=(1, len(q)),
+        compression="lzf",
+    )
+    return h5_file
+
+
+def _save_h5_row(dataset, index: int, I: np.ndarray) -> None:
+    """Write the intensities of one frame into a row of the HDF5 dataset."""
+    dataset[index] = I
+
+
+def _warm_up(mg: MultiGeometry, mask_data: list[np.ndarray], npt: int):
+    """Integrate empty images once so that pyFAI builds its CSR look-up tables.
+
+    Without this, building the look-up tables is part of the integration of
+    the first frame.
+
+    Returns
+    -------
+    Integrate1dResult
+        The result of the integration, its normalization and count do not
+        depend on the image data.
+    """
+    return mg.integrate1d(
+        [np.zeros(mask.shape, dtype=np.float32) for mask in mask_data],
+        npt=npt,
+        lst_mask=mask_data,
+        polarization_factor=1,
+        method=_CSR_METHOD,
+    )
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _csr_integrate(data, indices, indptr, stack, out):
+        """Multiply a CSR matrix with a stack of frames (one frame per column).
+
+        Every output bin is computed by a separate iteration of the parallel
+        loop, so no atomic operations are needed.
+        """
+        for row in prange(len(indptr) - 1):
+            for j in range(indptr[row], indptr[row + 1]):
+                value = data[j]
+                pixel = indices[j]
+                for frame in range(stack.shape[1]):
+                    out[row, frame] += value * stack[pixel, frame]
+
+
+class _SparseIntegrator:
+    """Integrate batches of frames with a single sparse matrix product.
+
+    pyFAI's CSR integration is a sparse matrix-vector product per detector
+    position. The CSR matrices of all detector positions, with the masked
+    pixels removed, are concatenated into one matrix so that a whole batch of
+    frames is integrated with one sparse matrix-matrix product. The
+    normalization (solid angle, polarization and mask) does not depend on the
+    frame and is taken from the warm-up integration, which also built the CSR
+    look-up tables.
+
+    Parameters
+    ----------
+    mg : MultiGeometry
+        MultiGeometry of all detector positions.
+    mask_data : list[np.ndarray]
+        Masks of all detector positions (non-zero pixels are masked).
+    warm_up_result : Integrate1dResult
+        Result of the warm-up integration with the same masks.
+    use_gpu : bool, optional
+        Upload the matrix once to the GPU and compute the products there.
+        Requires CuPy. On the CPU the products are computed by a parallel
+        Numba kernel if Numba is installed, otherwise by SciPy.
+    """
+
+    def __init__(
+        self,
+        mg: MultiGeometry,
+        mask_data: list[np.ndarray],
+        warm_up_result,
+        use_gpu: bool = False,
+    ):
+        npt = len(warm_up_result.radial)
+        matrices = []
+        for ai, mask in zip(mg.ais, mask_data):
+            engine = ai.engines[_CSR_METHOD].engine
+            matrix = sparse.csr_matrix(
+                (engine.data, engine.indices, engine.indptr), shape=(npt, mask.size)
+            )
+            valid = (mask.ravel() == 0).astype(np.float32)
+            matrices.append(matrix @ sparse.diags(valid))
+        self.matrix = sparse.hstack(matrices, format="csr")
+        # Drop the masked pixels, which are explicit zeros after the product
+        self.matrix.eliminate_zeros()
+
+        self.normalization = np.maximum(
+            warm_up_result.sum_normalization, np.finfo(np.float32).tiny
+        )
+        self.invalid = warm_up_result.count <= 0
+        self.empty = mg.empty
+
+        self.use_gpu = use_gpu
+        if use_gpu:
+            self.gpu_matrix = cupyx.scipy.sparse.csr_matrix(self.matrix)
+            self.gpu_normalization = cupy.asarray(self.normalization[:, None])
+
+    def integrate(self, frames: list[list[np.ndarray]], out: np.ndarray) -> None:
+        """Integrate a batch of frames.
+
+        Parameters
+        ----------
+        frames : list[list[np.ndarray]]
+            For each frame the images of all detector positions.
+        out : np.ndarray
+            Array with shape (len(frames), npt) the intensities are written to.
+        """
+        stack = np.empty((self.matrix.shape[1], len(frames)), dtype=np.float32)
+        for column, images in enumerate(frames):
+            stack[:, column] = np.concatenate([img.ravel() for img in images])
+        if self.use_gpu:
+            signal = self.gpu_matrix @ cupy.asarray(stack)
+            out[:] = cupy.asnumpy(signal / self.gpu_normalization).T
+        elif njit is not None:
+            signal = np.zeros((self.matrix.shape[0], len(frames)))
+            _csr_integrate(
+                self.matrix.data,
+                self.matrix.indices,
+                self.matrix.indptr,
+                stack,
+                signal,
+            )
+            np.divide(signal.T, self.normalization, out=out)
+        else:
+            signal = self.matrix @ stack
+            np.divide(signal.T, self.normalization, out=out)
+        out[:, self.invalid] = self.empty
+
+
 def integrate_multi(
-    input_dir: str, output_dir: str, config: Dict[str, DetectorConfig], progress_callback=None
+    input_dir: str,
+    output_dir: str,
+    config: Dict[str, DetectorConfig],
+    progress_callback=None,
+    batch_size: int = 1,
+    use_gpu: bool = False,
+    output_format: str = "xy",
 ) -> list[tuple[np.ndarray, np.ndarray]]:
     """Process and integrate data from multiple detector positions.
     
@@ -69,74 +316,198 @@ def integrate_multi(
         Each configuration must specify calibration and mask file paths.
     progress_callback : callable, optional
         Function to call with progress messages. Should accept a single string argument.
+    batch_size : int, optional
+        Number of frames which are integrated together. With the default of 1
+        every frame is integrated by pyFAI's MultiGeometry. Larger values
+        integrate all frames of a batch with a single sparse matrix product,
+        which is faster for many frames but keeps the whole batch in memory.
+    use_gpu : bool, optional
+        Compute the sparse matrix products of the batched integration on the
+        GPU. Requires CuPy, otherwise the integration falls back to the CPU.
+    output_format : str, optional
+        Either "xy" (default) to save every pattern as a separate .xy file, or
+        "h5" to save all patterns into a single HDF5 file with the datasets
+        ``q``, ``I`` (one row per pattern) and ``name``. The HDF5 output
+        requires h5py.
                
     Returns
     -------
     list[tuple[np.ndarray, np.ndarray]]
         List of tuples containing (q, I) arrays for each integrated pattern.
+    list[str]
+        The output .xy filename of each pattern, or for HDF5 output the name
+        of each pattern in the HDF5 file.
     """
+    if batch_size < 1:
+        raise ValueError(f"Batch size must be at least 1, got {batch_size}")
+    if output_format not in ("xy", "h5"):
+        raise ValueError(f"Unknown output format: {output_format}")
+
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Load mask data for all configurations
-    mask_data = [np.array(Image.open(cfg["mask"])) for cfg in config.values()]
-    
-    # Create MultiGeometry once
-    poni_filenames = [cfg["calibration"] for cfg in config.values()]
-    mg = MultiGeometry(poni_filenames, unit="q_A^-1")
-    
-    # Get sorted files for each configuration
-    config_files = {
-        config_name: get_sorted_files(input_dir, config_name)
-        for config_name in config.keys()
-    }
+    # Fix the order of the configurations once, all lists below follow it
+    config_names = list(config.keys())
+    configs = [config[name] for name in config_names]
+    mask_filenames = [cfg["mask"] for cfg in configs]
+    poni_filenames = [cfg["calibration"] for cfg in configs]
+
+    # Get sorted files for each configuration, they are validated before the
+    # masks and calibrations are loaded to fail early on misconfigured runs
+    config_files = [
+        get_sorted_files(input_dir, config_name) for config_name in config_names
+    ]
     
     # Check if any configuration has no files
-    if not any(config_files.values()):
+    if not any(config_files):
         raise ValueError("No files found in any configuration!")
     
     # Ensure all configurations have the same number of files
-    num_files = len(next(iter(config_files.values())))
-    if not all(len(files) == num_files for files in config_files.values()):
+    num_files = len(config_files[0])
+    if not all(len(files) == num_files for files in config_files):
         raise ValueError("Number of files don't match across all configurations!")
     
-    integrated_patterns = []
-    output_filenames = []
-    # Process each set of files
-    for i in range(num_files):
-        # Get the current file from each configuration
-        current_files = [files[i] for files in config_files.values()]
-        msg = f"Processing files: {[os.path.basename(f) for f in current_files]}"
+    # Load mask data for all configurations
+    mask_data = [_load_mask(filename) for filename in mask_filenames]
+    
+    # Create MultiGeometry once
+    mg = MultiGeometry(poni_filenames, unit="q_A^-1")
+
+    if use_gpu and cupy is None:
+        msg = "CuPy is not installed, integrating on the CPU"
         print(msg)
         if progress_callback:
             progress_callback(msg)
+        use_gpu = False
+
+    warm_up_result = _warm_up(mg, mask_data, npt=500)
+
+    # Build the batched integrator once, it is not needed for single frames
+    # integrated on the CPU
+    sparse_integrator = (
+        _SparseIntegrator(mg, mask_data, warm_up_result, use_gpu=use_gpu)
+        if batch_size > 1 or use_gpu
+        else None
+    )
+
+    # The radial axis is the same for all frames, the intensities of all
+    # frames are written into one preallocated array
+    q = warm_up_result.radial
+    intensities = np.empty((num_files, len(q)))
+
+    # Extract the base names from the files of the first configuration
+    # (removing configuration name and extension)
+    base_names = [
+        _BASE_NAME_PATTERN.sub("", os.path.basename(first_file))
+        for first_file in config_files[0]
+    ]
+    # Pattern names with the base name (index starting from 1)
+    pattern_names = [
+        f"{base_name}_{i+1:04d}" for i, base_name in enumerate(base_names)
+    ]
+    if output_format == "h5":
+        h5_filename = os.path.join(output_dir, f"{base_names[0]}.h5")
+        output_context = _create_h5_output(h5_filename, q, pattern_names)
+        output_filenames = pattern_names
+    else:
+        output_context = nullcontext()
+        output_filenames = [
+            os.path.join(output_dir, f"{name}.xy") for name in pattern_names
+        ]
+
+    # The images are loaded into preallocated buffers, so that the memory of
+    # the detector-sized arrays is not allocated and page-faulted for every
+    # frame. Each frame uses the next set of buffers in turn, there are enough
+    # sets for the frames of a batch plus the prefetched next frame.
+    num_buffers = min(num_files, (batch_size if sparse_integrator else 1) + 1)
+    image_buffers = [
+        [np.empty(mask.shape, dtype=np.float32) for mask in mask_data]
+        for _ in range(num_buffers)
+    ]
+
+    pending_writes = []
+    batch = []
+    # Load the images of all detector positions of a frame in parallel, the
+    # executor is kept alive across frames to avoid thread start-up costs.
+    # The integrated patterns are written by a separate background thread so
+    # that formatting and writing the output does not block the integration.
+    # The HDF5 file is closed only after the writer has finished.
+    with output_context as h5_file, ThreadPoolExecutor(
+        max_workers=len(configs)
+    ) as executor, ThreadPoolExecutor(max_workers=1) as writer:
+        # Start loading the first frame, afterwards the next frame is always
+        # loaded while the current one is being integrated
+        next_images = [
+            executor.submit(_load_image, files[0], out)
+            for files, out in zip(config_files, image_buffers[0])
+        ]
+
+        # Process each set of files
+        for i in range(num_files):
+            # Get the current file from each configuration
+            current_files = [files[i] for files in config_files]
+            msg = f"Processing files: {[os.path.basename(f) for f in current_files]}"
+            print(msg)
+            if progress_callback:
+                progress_callback(msg)
         
-        # Extract base name from first file (removing configuration name and extension)
-        first_file = os.path.basename(current_files[0])
-        base_name = re.sub(r'_[^_]+_\d+\.tiff?$', '', first_file)
-        
-        # Load data from all files
-        img_data = [fabio.open(img_file).data[::-1] for img_file in current_files]
-        
-        # Integrate using the provided MultiGeometry
-        q, I = mg.integrate1d(
-            img_data, npt=500, lst_mask=mask_data, polarization_factor=1
-        )
-        integrated_patterns.append((q, I))
-        
-        # Save the integrated pattern with the base name (index starting from 1)
-        output_filename = os.path.join(output_dir, f"{base_name}_{i+1:04d}.xy")
-        output_filenames.append(output_filename)
-        np.savetxt(
-            output_filename,
-            np.column_stack((q, I)),
-            header="q(A^-1) I(a.u.)",
-            comments="# ",
-        )
-        msg = f"Saved integrated pattern to: {output_filename}"
-        print(msg)
-        if progress_callback:
-            progress_callback(msg)
-        print()  # Add blank line after each save message
-    
+            # Wait for the data of the current frame and prefetch the next one
+            img_data = [future.result() for future in next_images]
+            if i + 1 < num_files:
+                next_images = [
+                    executor.submit(_load_image, files[i + 1], out)
+                    for files, out in zip(
+                        config_files, image_buffers[(i + 1) % num_buffers]
+                    )
+                ]
+
+            # Integrate using the provided MultiGeometry, or collect the frame
+            # until a full batch can be integrated at once
+            if sparse_integrator is None:
+                _, intensities[i] = mg.integrate1d(
+                    img_data,
+                    npt=500,
+                    lst_mask=mask_data,
+                    polarization_factor=1,
+                    method=_CSR_METHOD,
+                )
+                first_index = i
+            else:
+                batch.append(img_data)
+                if len(batch) < batch_size and i + 1 < num_files:
+                    continue
+                first_index = i + 1 - len(batch)
+                sparse_integrator.integrate(batch, out=intensities[first_index : i + 1])
+                batch = []
+
+            # Save the integrated patterns
+            for index in range(first_index, i + 1):
+                if h5_file is None:
+                    output_filename = output_filenames[index]
+                    pending_writes.append(
+                        writer.submit(
+                            _save_pattern, output_filename, q, intensities[index]
+                        )
+                    )
+                    msg = f"Writing integrated pattern to: {output_filename}"
+                else:
+                    pending_writes.append(
+                        writer.submit(
+                            _save_h5_row, h5_file["I"], index, intensities[index]
+                        )
+                    )
+                    msg = (
+                        f"Writing integrated pattern {pattern_names[index]} "
+                        f"to: {h5_filename}"
+                    )
+                print(msg)
+                if progress_callback:
+                    progress_callback(msg)
+                print()  # Add blank line after each save message
+
+    # Raise any error which occurred while writing the output files
+    for future in pending_writes:
+        future.result()
+
+    integrated_patterns = [(q, I) for I in intensities]
     return integrated_patterns, output_filenames
\ No newline at end of file
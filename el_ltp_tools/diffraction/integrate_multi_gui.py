@@ -1,6 +1,7 @@
 import sys
 import os
 import json
+from collections import OrderedDict
 import numpy as np
 import matplotlib
 
@@ -8,7 +9,9 @@ matplotlib.use("Qt5Agg")  # Set the backend to Qt before importing pyplot
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -18,7 +21,7 @@ from PyQt6.QtWidgets import (
     QLineEdit,
     QPushButton,
     QFileDialog,
-    QTextEdit,
+    QPlainTextEdit,
     QGroupBox,
     QTableWidget,
     QTableWidgetItem,
@@ -27,50 +30,143 @@ from PyQt6.QtWidgets import (
     QStyledItemDelegate,
     QDialog,
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
-from PyQt6.QtGui import QPainter, QFontMetrics
+from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtGui import (
+    QPainter,
+    QFontMetrics,
+    QTextCursor,
+    QTextCharFormat,
+    QColor,
+    QFont,
+)
+from ..gui_worker import ProgressWorker
 from datetime import datetime
 
+# Up to this number of patterns every pattern gets a legend entry, more
+# patterns are identified by a colorbar over the pattern index
+_MAX_LEGEND_ENTRIES = 20
+
+# Number of elided texts cached by the file path delegate
+_ELIDE_CACHE_SIZE = 256
+
+# Number of lines kept in the log, older lines are dropped
+_MAX_LOG_LINES = 5000
+
+# Tooltips of the browse buttons in the configuration table
+_CALIBRATION_TOOLTIP = "Select calibration file (.poni) for this detector position"
+_MASK_TOOLTIP = "Select mask file (.mask) for this detector position"
+
+# Alignment of the file paths in the configuration table
+_RIGHT_ALIGNMENT = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+
+
+def offset_patterns(integrated_patterns, spacing=0.05):
+    """Offset integrated patterns vertically so that they can be plotted together.
+
+    Every pattern is shifted by its index times ``spacing`` times the
+    intensity range of all patterns.
+
+    Parameters
+    ----------
+    integrated_patterns : list[tuple[np.ndarray, np.ndarray]]
+        List of (q, I) tuples.
+    spacing : float, optional
+        Offset between neighbouring patterns as fraction of the intensity range.
+
+    Returns
+    -------
+    list[np.ndarray]
+        The (npt, 2) arrays of q and offset intensity of every pattern.
+    float
+        Minimum offset intensity.
+    float
+        Maximum offset intensity.
+    """
+    intensities = [I for _, I in integrated_patterns]
+    if len({len(I) for I in intensities}) == 1:
+        # All patterns have the same length, reduce and offset them at once
+        stack = np.stack(intensities)
+        min_intensity = stack.min()
+        max_intensity = stack.max()
+        spacing_offset = (max_intensity - min_intensity) * spacing
+        offset_intensities = (
+            stack + np.arange(len(stack))[:, None] * spacing_offset
+        )
+    else:
+        min_intensity = min(I.min() for I in intensities)
+        max_intensity = max(I.max() for I in intensities)
+        spacing_offset = (max_intensity - min_intensity) * spacing
+        offset_intensities = [
+            I + i * spacing_offset for i, I in enumerate(intensities)
+        ]
+
+    segments = [
+        np.column_stack((q, I))
+        for (q, _), I in zip(integrated_patterns, offset_intensities)
+    ]
+    return (
+        segments,
+        min_intensity,
+        max_intensity + (len(segments) - 1) * spacing_offset,
+    )
+
 
 class RightAlignElideLeftDelegate(QStyledItemDelegate):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Font metrics per font and elided texts per (text, width, font), so
+        # that repaints of unchanged cells do not measure the text again
+        self._font_metrics = {}
+        self._elided_texts = OrderedDict()
+
+    def elided_text(self, text, font, width):
+        """Return the text elided from the left to fit into the width."""
+        font_key = font.key()
+        key = (text, width, font_key)
+        elided = self._elided_texts.get(key)
+        if elided is not None:
+            self._elided_texts.move_to_end(key)
+            return elided
+
+        font_metrics = self._font_metrics.get(font_key)
+        if font_metrics is None:
+            font_metrics = self._font_metrics[font_key] = QFontMetrics(font)
+        elided = font_metrics.elidedText(text, Qt.TextElideMode.ElideLeft, width)
+
+        self._elided_texts[key] = elided
+        if len(self._elided_texts) > _ELIDE_CACHE_SIZE:
+            self._elided_texts.popitem(last=False)
+        return elided
+
     def initStyleOption(self, option, index):
         super().initStyleOption(option, index)
-        option.displayAlignment = (
-            Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
-        )
+        option.displayAlignment = _RIGHT_ALIGNMENT
 
     def paint(self, painter: QPainter, option, index):
+        # Nothing to draw for empty cells
+        text = index.data(Qt.ItemDataRole.DisplayRole)
+        if not text:
+            return
+
         # Customize elided text
         painter.save()
 
-        text = index.data(Qt.ItemDataRole.DisplayRole)
-        if text is None:
-            text = ""
-
         # Get the rect for the text
         text_rect = option.rect
         text_rect.setRight(text_rect.right() - 4)  # Add some padding
 
-        # Prepare font metrics and elide from left
-        font_metrics = QFontMetrics(option.font)
-        elided = font_metrics.elidedText(
-            text, Qt.TextElideMode.ElideLeft, text_rect.width()
-        )
+        # Elide from left
+        elided = self.elided_text(text, option.font, text_rect.width())
 
         # Draw the text
-        painter.drawText(
-            text_rect,
-            Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter,
-            elided,
-        )
+        painter.drawText(text_rect, _RIGHT_ALIGNMENT, elided)
 
         painter.restore()
 
 
-class IntegrationWorker(QThread):
+class IntegrationWorker(ProgressWorker):
     """Worker thread for running the integration process."""
 
-    progress = pyqtSignal(str)
     finished = pyqtSignal(
         list, list
     )  # Changed to emit the integrated patterns and output filenames
@@ -81,13 +177,6 @@ class IntegrationWorker(QThread):
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.file_configs = file_configs
-        self._is_running = True
-
-    def stop(self):
-        self._is_running = False
-
-    def should_continue(self):
-        return self._is_running
 
     def run(self):
         try:
@@ -101,18 +190,17 @@ class IntegrationWorker(QThread):
             # Import integrate_multi here to ensure we have the latest version
             from . import integrate_multi
 
-            def progress_callback(msg):
-                if self._is_running:  # Only emit if we're still running
-                    self.progress.emit(msg)
-                    print(f"Progress callback: {msg}")  # Debug print
-
             # Run integration with progress callback
-            integrated_patterns, output_filenames = integrate_multi(
-                self.input_dir,
-                self.output_dir,
-                self.file_configs,
-                progress_callback=progress_callback,
-            )
+            try:
+                integrated_patterns, output_filenames = integrate_multi(
+                    self.input_dir,
+                    self.output_dir,
+                    self.file_configs,
+                    progress_callback=self._queue_progress,
+                )
+            finally:
+                # Send the remaining messages before the result or the error
+                self._flush_progress()
 
             # Only emit finished if we completed normally (not stopped)
             if self._is_running:
@@ -221,6 +309,11 @@ class MainWindow(QMainWindow):
 
         self.config_table.setMinimumHeight(200)
 
+        # Style all browse buttons of the table at once instead of per button
+        self.config_table.setStyleSheet(
+            "QPushButton#cellBrowse { padding: 0px; margin: 0px; }"
+        )
+
         # Apply custom delegate to file path columns
         delegate = RightAlignElideLeftDelegate()
         self.config_table.setItemDelegateForColumn(
@@ -238,25 +331,8 @@ class MainWindow(QMainWindow):
             mask_item = QTableWidgetItem(default_mask)
 
             # Create browse buttons
-            cal_browse = QPushButton("...")
-            cal_browse.setFixedWidth(45)
-            cal_browse.setStyleSheet("padding: 0px; margin: 0px;")
-            cal_browse.setToolTip(
-                "Select calibration file (.poni) for this detector position"
-            )
-            cal_browse.clicked.connect(
-                lambda checked, row=i: self.browse_file(row, "calibration")
-            )
-
-            mask_browse = QPushButton("...")
-            mask_browse.setFixedWidth(45)
-            mask_browse.setStyleSheet("padding: 0px; margin: 0px;")
-            mask_browse.setToolTip(
-                "Select mask file (.mask) for this detector position"
-            )
-            mask_browse.clicked.connect(
-                lambda checked, row=i: self.browse_file(row, "mask")
-            )
+            cal_browse = self.create_browse_button("calibration")
+            mask_browse = self.create_browse_button("mask")
 
             self.config_table.setItem(i, 0, name_item)
             self.config_table.setItem(i, 1, cal_item)
@@ -267,6 +343,16 @@ class MainWindow(QMainWindow):
         # Connect cell changed signal
         self.config_table.cellChanged.connect(self.handle_cell_changed)
 
+        # The contents of the table are cached until the table model changes,
+        # the model signals are also sent while the table blocks its signals
+        self._config_rows = None
+        self._config_data = None
+        model = self.config_table.model()
+        model.dataChanged.connect(self.invalidate_config_cache)
+        model.rowsInserted.connect(self.invalidate_config_cache)
+        model.rowsRemoved.connect(self.invalidate_config_cache)
+        model.modelReset.connect(self.invalidate_config_cache)
+
         # Add/Remove row buttons
         button_layout = QHBoxLayout()
         add_row_btn = QPushButton("Add Row")
@@ -338,9 +424,11 @@ class MainWindow(QMainWindow):
         log_group = QGroupBox("Output Log")
         log_layout = QVBoxLayout()
 
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
         self.log_output.setMaximumHeight(200)  # Limit the height of the log
+        self.log_output.setMaximumBlockCount(_MAX_LOG_LINES)
+        self._log_cursor = QTextCursor(self.log_output.document())
         log_layout.addWidget(self.log_output)
 
         # Add clear button below log
@@ -386,6 +474,9 @@ class MainWindow(QMainWindow):
         # Initialize worker
         self.worker = None
 
+        # The plot dialog is created on the first finished integration
+        self.plot_dialog = None
+
         # Load saved state
         self.load_state()
 
@@ -408,10 +499,7 @@ class MainWindow(QMainWindow):
         }
 
         # Save configuration table
-        for row in range(self.config_table.rowCount()):
-            name = self.config_table.item(row, 0).text()
-            calibration = self.config_table.item(row, 1).text()
-            mask = self.config_table.item(row, 3).text()
+        for name, calibration, mask in self.get_config_rows():
             state["config_table"].append(
                 {"name": name, "calibration": calibration, "mask": mask}
             )
@@ -440,21 +528,29 @@ class MainWindow(QMainWindow):
             # Load configuration table
             config_table = state.get("config_table", [])
             if config_table:
-                self.config_table.setRowCount(len(config_table))
-                for row, config in enumerate(config_table):
-                    self.config_table.setItem(row, 0, QTableWidgetItem(config["name"]))
-
-                    cal_item = QTableWidgetItem(config["calibration"])
-                    cal_item.setTextAlignment(
-                        int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                    )
-                    self.config_table.setItem(row, 1, cal_item)
-
-                    mask_item = QTableWidgetItem(config["mask"])
-                    mask_item.setTextAlignment(
-                        int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                    )
-                    self.config_table.setItem(row, 3, mask_item)
+                # Fill the table without a cellChanged signal and a repaint per
+                # item, the tooltips are set here instead of in the handler
+                self.config_table.blockSignals(True)
+                self.config_table.setUpdatesEnabled(False)
+                try:
+                    self.config_table.setRowCount(len(config_table))
+                    for row, config in enumerate(config_table):
+                        self.config_table.setItem(
+                            row, 0, QTableWidgetItem(config["name"])
+                        )
+
+                        cal_item = QTableWidgetItem(config["calibration"])
+                        cal_item.setTextAlignment(_RIGHT_ALIGNMENT)
+                        cal_item.setToolTip(config["calibration"])
+                        self.config_table.setItem(row, 1, cal_item)
+
+                        mask_item = QTableWidgetItem(config["mask"])
+                        mask_item.setTextAlignment(_RIGHT_ALIGNMENT)
+                        mask_item.setToolTip(config["mask"])
+                        self.config_table.setItem(row, 3, mask_item)
+                finally:
+                    self.config_table.blockSignals(False)
+                    self.config_table.setUpdatesEnabled(True)
 
         except FileNotFoundError:
             # No saved state, use defaults
@@ -482,12 +578,25 @@ class MainWindow(QMainWindow):
     def log(self, message):
         """Add a message to the log output."""
         if message.startswith("Error:"):
-            self.log_output.append(f'<span style="color: red;">{message}</span>')
+            self.append_log(message, color="red")
         else:
-            self.log_output.append(message)
-            # Add a blank line after "saved integrated pattern" messages
-            if "saved integrated pattern" in message:
-                self.log_output.append("")
+            self.log_output.appendPlainText(message)
+
+    def append_log(self, message, color=None, bold=False):
+        """Append a line to the log output with the given color and weight."""
+        self.log_output.appendPlainText(message)
+        char_format = QTextCharFormat()
+        if color is not None:
+            char_format.setForeground(QColor(color))
+        if bold:
+            char_format.setFontWeight(QFont.Weight.Bold)
+
+        # Select the appended line and apply the format to it
+        self._log_cursor.movePosition(QTextCursor.MoveOperation.End)
+        self._log_cursor.movePosition(
+            QTextCursor.MoveOperation.StartOfBlock, QTextCursor.MoveMode.KeepAnchor
+        )
+        self._log_cursor.setCharFormat(char_format)
 
     def handle_cell_changed(self, row, column):
         """Handle cell changes in the configuration table."""
@@ -497,46 +606,61 @@ class MainWindow(QMainWindow):
                 # Set tooltip to show full path
                 item.setToolTip(item.text())
 
-    def add_config_row(self):
-        current_row = self.config_table.rowCount()
-        self.config_table.insertRow(current_row)
-        self.config_table.setItem(current_row, 0, QTableWidgetItem(""))
-
-        # Create items
-        cal_item = QTableWidgetItem("")
-        mask_item = QTableWidgetItem("")
-
-        # Create browse buttons
-        cal_browse = QPushButton("...")
-        cal_browse.setFixedWidth(45)
-        cal_browse.setStyleSheet("padding: 0px; margin: 0px;")
-        cal_browse.setToolTip(
-            "Select calibration file (.poni) for this detector position"
-        )
-        cal_browse.clicked.connect(
-            lambda checked, row=current_row: self.browse_file(row, "calibration")
-        )
+    def create_browse_button(self, file_type):
+        """Create a browse button for the configuration table.
+
+        The button is styled by the stylesheet of the table via its object name.
+        All buttons are connected to the same slot, which looks up the row of
+        the clicked button, so no row numbers are stored in the connections.
 
-        mask_browse = QPushButton("...")
-        mask_browse.setFixedWidth(45)
-        mask_browse.setStyleSheet("padding: 0px; margin: 0px;")
-        mask_browse.setToolTip("Select mask file (.mask) for this detector position")
-        mask_browse.clicked.connect(
-            lambda checked, row=current_row: self.browse_file(row, "mask")
+        Args:
+            file_type: Either "calibration" or "mask"
+        """
+        button = QPushButton("...")
+        button.setObjectName("cellBrowse")
+        button.setFixedWidth(45)
+        button.setToolTip(
+            _CALIBRATION_TOOLTIP if file_type == "calibration" else _MASK_TOOLTIP
         )
+        button.setProperty("file_type", file_type)
+        button.clicked.connect(self.browse_button_clicked)
+        return button
 
-        self.config_table.setItem(current_row, 1, cal_item)
-        self.config_table.setCellWidget(current_row, 2, cal_browse)
-        self.config_table.setItem(current_row, 3, mask_item)
-        self.config_table.setCellWidget(current_row, 4, mask_browse)
+    def browse_button_clicked(self):
+        """Open the file dialog for the row of the clicked browse button."""
+        button = self.sender()
+        row = self.config_table.indexAt(button.pos()).row()
+        if row >= 0:
+            self.browse_file(row, button.property("file_type"))
 
-        # Set alignment after setting items
-        cal_item.setTextAlignment(
-            int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-        )
-        mask_item.setTextAlignment(
-            int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-        )
+    def add_config_row(self):
+        # Insert the complete row without signals and repaints in between
+        self.config_table.blockSignals(True)
+        self.config_table.setUpdatesEnabled(False)
+        try:
+            current_row = self.config_table.rowCount()
+            self.config_table.insertRow(current_row)
+            self.config_table.setItem(current_row, 0, QTableWidgetItem(""))
+
+            # Create items
+            cal_item = QTableWidgetItem("")
+            mask_item = QTableWidgetItem("")
+
+            # Create browse buttons
+            cal_browse = self.create_browse_button("calibration")
+            mask_browse = self.create_browse_button("mask")
+
+            self.config_table.setItem(current_row, 1, cal_item)
+            self.config_table.setCellWidget(current_row, 2, cal_browse)
+            self.config_table.setItem(current_row, 3, mask_item)
+            self.config_table.setCellWidget(current_row, 4, mask_browse)
+
+            # Set alignment after setting items
+            cal_item.setTextAlignment(_RIGHT_ALIGNMENT)
+            mask_item.setTextAlignment(_RIGHT_ALIGNMENT)
+        finally:
+            self.config_table.blockSignals(False)
+            self.config_table.setUpdatesEnabled(True)
 
     def remove_config_row(self):
         current_row = self.config_table.currentRow()
@@ -588,31 +712,42 @@ class MainWindow(QMainWindow):
             if file_type == "calibration":
                 item = self.config_table.item(row, 1)
                 item.setText(file_path)
-                item.setTextAlignment(
-                    int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                )
+                item.setTextAlignment(_RIGHT_ALIGNMENT)
                 self.last_calibration_dir = os.path.dirname(file_path)
             else:
                 item = self.config_table.item(row, 3)
                 item.setText(file_path)
-                item.setTextAlignment(
-                    int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-                )
+                item.setTextAlignment(_RIGHT_ALIGNMENT)
                 self.last_mask_dir = os.path.dirname(file_path)
 
-    def get_config_table_data(self):
-        """Get the full configuration data from the table."""
-        file_configs = {}
-        for row in range(self.config_table.rowCount()):
-            name = self.config_table.item(row, 0).text()
-            calibration = self.config_table.item(row, 1).text()
-            mask = self.config_table.item(row, 3).text()  # Updated column index
+    def invalidate_config_cache(self, *args):
+        """Clear the cached table contents after a change of the table."""
+        self._config_rows = None
+        self._config_data = None
+
+    def get_config_rows(self):
+        """Get the name, calibration and mask file of every table row."""
+        if self._config_rows is None:
+            item = self.config_table.item
+            self._config_rows = [
+                (item(row, 0).text(), item(row, 1).text(), item(row, 3).text())
+                for row in range(self.config_table.rowCount())
+            ]
+        return self._config_rows
 
-            if not name or not calibration or not mask:
-                continue
+    def get_config_table_data(self):
+        """Get the full configuration data from the table.
 
-            file_configs[name] = {"calibration": calibration, "mask": mask}
-        return file_configs
+        Rows with an empty field are skipped. The result is cached until the
+        table changes.
+        """
+        if self._config_data is None:
+            self._config_data = {
+                name: {"calibration": calibration, "mask": mask}
+                for name, calibration, mask in self.get_config_rows()
+                if name and calibration and mask
+            }
+        return self._config_data
 
     def start_integration(self):
         # Validate inputs
@@ -636,15 +771,13 @@ class MainWindow(QMainWindow):
         self.stop_button.setEnabled(True)
 
         # Add separator to log
-        self.log_output.append("=" * 40)
-        self.log_output.append(
-            '<span style="color: #CCCCCC; font-weight: bold;">▶ Starting new integration process</span>'
-        )
-        self.log_output.append(
-            f'<span style="color: gray;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</span>'
+        self.log_output.appendPlainText("=" * 40)
+        self.append_log(
+            "▶ Starting new integration process", color="#CCCCCC", bold=True
         )
-        self.log_output.append("=" * 40)
-        self.log_output.append("")
+        self.append_log(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), color="gray")
+        self.log_output.appendPlainText("=" * 40)
+        self.log_output.appendPlainText("")
 
         # Start integration
         self.worker = IntegrationWorker(
@@ -663,43 +796,24 @@ class MainWindow(QMainWindow):
     def stop_integration(self):
         if self.worker is not None:
             self.worker.stop()
-            self.log_output.append("")
-            self.log_output.append("=" * 40)
-            self.log_output.append(
-                '<span style="color: red; font-weight: bold;">■ Integration stopped by user</span>'
-            )
-            self.log_output.append(
-                f'<span style="color: gray;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</span>'
-            )
-            self.log_output.append("=" * 40)
-            self.log_output.append("")
+            self.log_output.appendPlainText("")
+            self.log_output.appendPlainText("=" * 40)
+            self.append_log("■ Integration stopped by user", color="red", bold=True)
+            self.append_log(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), color="gray")
+            self.log_output.appendPlainText("=" * 40)
+            self.log_output.appendPlainText("")
             self.start_button.setEnabled(True)
             self.stop_button.setEnabled(False)
 
-    def integration_finished(self, integrated_patterns, output_filenames):
-        self.start_button.setEnabled(True)
-        self.stop_button.setEnabled(False)
-        self.log_output.append("")
-        self.log_output.append("=" * 40)
-        self.log_output.append(
-            '<span style="color: green; font-weight: bold;">✓ Integration completed successfully</span>'
-        )
-        self.log_output.append(
-            f'<span style="color: gray;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</span>'
-        )
-        self.log_output.append("=" * 40)
-        self.log_output.append("")
+    def get_plot_dialog(self):
+        """Get the dialog for the integrated patterns, creating it on first use.
 
-        base_output_filenames = [os.path.basename(f) for f in output_filenames]
-
-        # Plot the integrated patterns
-        try:
-            # Create a new dialog window for the plot
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        The dialog, its figure and canvas are kept and reused for later
+        integrations. The figure uses the constrained layout, which is updated
+        on every draw instead of running tight_layout on the new plot.
+        """
+        if self.plot_dialog is None:
             plot_dialog = QDialog(self)
-            plot_dialog.setWindowTitle(
-                f"EL-LTP Tools - Integrated Diffraction Patterns - {current_time}"
-            )
             plot_dialog.resize(1200, 800)
             plot_dialog.setWindowFlags(
                 plot_dialog.windowFlags() | Qt.WindowType.WindowStaysOnTopHint
@@ -709,35 +823,81 @@ class MainWindow(QMainWindow):
             layout = QVBoxLayout(plot_dialog)
 
             # Create figure and canvas
-            fig = Figure(figsize=(12, 8))
-            canvas = FigureCanvas(fig)
+            self.plot_figure = Figure(figsize=(12, 8), layout="constrained")
+            self.plot_canvas = FigureCanvas(self.plot_figure)
 
             # Add navigation toolbar
-            toolbar = NavigationToolbar(canvas, plot_dialog)
+            toolbar = NavigationToolbar(self.plot_canvas, plot_dialog)
             layout.addWidget(toolbar)
-            layout.addWidget(canvas)
+            layout.addWidget(self.plot_canvas)
+
+            self.plot_dialog = plot_dialog
+        return self.plot_dialog
+
+    def integration_finished(self, integrated_patterns, output_filenames):
+        self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.log_output.appendPlainText("")
+        self.log_output.appendPlainText("=" * 40)
+        self.append_log(
+            "✓ Integration completed successfully", color="green", bold=True
+        )
+        self.append_log(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), color="gray")
+        self.log_output.appendPlainText("=" * 40)
+        self.log_output.appendPlainText("")
+
+        base_output_filenames = [os.path.basename(f) for f in output_filenames]
+
+        # Plot the integrated patterns
+        try:
+            # Reuse the dialog window for the plot, only the figure is cleared
+            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            plot_dialog = self.get_plot_dialog()
+            plot_dialog.setWindowTitle(
+                f"EL-LTP Tools - Integrated Diffraction Patterns - {current_time}"
+            )
+            fig = self.plot_figure
+            fig.clear()
 
             # Create the plot
             ax = fig.add_subplot(111)
 
-            # Calculate the offset for vertical spacing
-            # Get the maximum intensity across all patterns
-            max_intensity = max(max(I) for _, I in integrated_patterns)
-            min_intensity = min(min(I) for _, I in integrated_patterns)
-            spacing_offset = (
-                max_intensity - min_intensity
-            ) * 0.05  # 5% of data range as spacing
+            # Add an offset to the intensity that increases with each pattern,
+            # all patterns are drawn as a single collection instead of one
+            # line per pattern
+            segments, min_intensity, max_intensity = offset_patterns(
+                integrated_patterns
+            )
+            lines = LineCollection(
+                segments, array=np.arange(len(segments)), cmap="viridis"
+            )
+            ax.add_collection(lines)
 
-            for i, (q, I) in enumerate(integrated_patterns):
-                # Add an offset to the intensity that increases with each pattern
-                offset_I = I + (i * spacing_offset)
-                ax.plot(q, offset_I, label=f"{base_output_filenames[i]}")
+            # Set the limits directly, collections are not autoscaled
+            ax.set_xlim(
+                min(q.min() for q, _ in integrated_patterns),
+                max(q.max() for q, _ in integrated_patterns),
+            )
+            ax.set_ylim(min_intensity, max_intensity)
 
             ax.set_xlabel("q (Å⁻¹)")
             ax.set_ylabel("Intensity (a.u.)")
             ax.set_title("Integrated Diffraction Patterns")
-            ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
-            fig.tight_layout()
+            if len(segments) <= _MAX_LEGEND_ENTRIES:
+                # Proxy artists with the colors of the patterns in the collection
+                handles = [
+                    Line2D([], [], color=color)
+                    for color in lines.to_rgba(lines.get_array())
+                ]
+                ax.legend(
+                    handles,
+                    base_output_filenames,
+                    bbox_to_anchor=(1.05, 1),
+                    loc="upper left",
+                )
+            else:
+                fig.colorbar(lines, ax=ax, label="Pattern")
+            self.plot_canvas.draw()
 
             # Show the dialog non-modally
             plot_dialog.show()
@@ -0,0 +1,87 @@
+import threading
+
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal
+
+# Interval in milliseconds in which the progress messages of a worker are
+# collected and sent to the GUI thread as a single signal
+_PROGRESS_INTERVAL = 1000 // 30
+
+
+class ProgressWorker(QThread):
+    """Worker thread which can be stopped and sends its progress in batches.
+
+    Every emitted signal is queued into the GUI thread and appended to the
+    log, so the progress messages of the worker are collected by
+    ``_queue_progress`` and sent as one signal at most every
+    ``_PROGRESS_INTERVAL`` milliseconds. A timer in the GUI thread sends the
+    collected messages, so they also arrive while the worker is busy and
+    sends no further messages.
+
+    Signals
+    -------
+    progress : pyqtSignal(str)
+        Emitted with the progress messages collected since the last signal,
+        separated by newlines.
+    """
+
+    progress = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._is_running = True
+        self._pending_messages = []
+        self._progress_lock = threading.Lock()
+        # The timer belongs to the thread object, which lives in the GUI thread
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setInterval(_PROGRESS_INTERVAL)
+        self._progress_timer.timeout.connect(self._send_progress)
+
+    def start(self, *args, **kwargs):
+        """Start the thread and the timer which sends its progress messages."""
+        self._progress_timer.start()
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        """Stop the processing thread."""
+        self._is_running = False
+
+    def should_continue(self):
+        """Check if processing should continue.
+
+        Returns
+        -------
+        bool
+            True if processing should continue, False if it should stop.
+        """
+        return self._is_running
+
+    def _queue_progress(self, message):
+        """Collect a progress message until the next batch is sent.
+
+        Parameters
+        ----------
+        message : str
+            The progress message.
+        """
+        if not self._is_running:
+            return
+        with self._progress_lock:
+            self._pending_messages.append(message)
+
+    def _flush_progress(self):
+        """Send all collected progress messages as one signal.
+
+        The timer calls this in the GUI thread. The worker calls it once at the
+        end of ``run``, so the last messages arrive before its result.
+        """
+        with self._progress_lock:
+            messages = self._pending_messages
+            self._pending_messages = []
+        if messages and self._is_running:
+            self.progress.emit("\n".join(messages))
+
+    def _send_progress(self):
+        """Send the collected messages and stop the timer after the thread."""
+        self._flush_progress()
+        if self.isFinished():
+            self._progress_timer.stop()
@@ -53,7 +53,6 @@ The script will:
 
 import argparse
 import os
-import json
 from el_ltp_tools.combine_images import process_measurements
 
 
@@ -173,6 +172,25 @@ Example: --config center 2 --config side 2"""
              "Pixels below this intensity will not be considered as cosmic rays. "
              "Adjust based on your image intensity range"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes which combine the directories of a group "
+             "concurrently (default: 1)"
+    )
+    parser.add_argument(
+        "--gpu",
+        action="store_true",
+        help="Detect the cosmic rays on the GPU. Requires CuPy, otherwise the "
+             "detection falls back to the CPU"
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print the progress messages, which speeds up runs over "
+             "many directories on slow consoles"
+    )
     return parser.parse_args()
 
 
@@ -183,25 +201,28 @@ def main():
     # Create output directory if it doesn't exist
     os.makedirs(args.output, exist_ok=True)
     
-    # Convert individual config arguments to JSON if provided
+    # Use the individual config arguments if provided, the JSON string is
+    # parsed by process_measurements
     if args.config:
-        config = {name: int(num_dirs) for name, num_dirs in args.config}
-        config_json = json.dumps([config])
+        config = [{name: int(num_dirs) for name, num_dirs in args.config}]
     else:
-        config_json = args.config_json
+        config = args.config_json
     
     # Process the measurements
     process_measurements(
         input_directory=args.input,
         output_directory=args.output,
-        config=config_json,
+        config=config,
         start_index=args.start,
         end_index=args.end,
         cosmic_sigma=args.cosmic_sigma,
         cosmic_window=args.cosmic_window,
         cosmic_iterations=args.cosmic_iterations,
         cosmic_min=args.cosmic_min,
-        prefix=args.prefix
+        prefix=args.prefix,
+        num_workers=args.workers,
+        use_gpu=args.gpu,
+        log=(lambda message: None) if args.quiet else print,
     )
     
     print(f"Processing complete! Combined images have been saved to: {args.output}")
@@ -91,6 +91,31 @@ Format: {"detector_name": {"calibration": "path/to/calibration.json", "mask": "p
 Example: '{"detector1": {"calibration": "cal1.json", "mask": "mask1.npy"}}'""",
     )
 
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of frames which are integrated together (default: 1). Larger values "
+        "integrate a whole batch of frames with a single sparse matrix product, which is "
+        "faster for many frames but keeps the whole batch in memory.",
+    )
+
+    parser.add_argument(
+        "--gpu",
+        action="store_true",
+        help="Compute the batched integration on the GPU. Requires CuPy, otherwise the "
+        "integration falls back to the CPU.",
+    )
+
+    parser.add_argument(
+        "--output-format",
+        choices=["xy", "h5"],
+        default="xy",
+        help="Format of the integrated patterns (default: xy). 'xy' saves every pattern "
+        "as a separate .xy file, 'h5' saves all patterns into a single compressed HDF5 "
+        "file with the datasets q, I and name.",
+    )
+
     return parser.parse_args()
 
 
@@ -147,7 +172,12 @@ def main():
 
     # Process the data
     integrated_patterns, output_filenames = integrate_multi(
-        args.input_dir, args.output_dir, file_configs
+        args.input_dir,
+        args.output_dir,
+        file_configs,
+        batch_size=args.batch_size,
+        use_gpu=args.gpu,
+        output_format=args.output_format,
     )
 
     print(
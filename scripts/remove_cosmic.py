@@ -89,7 +89,7 @@ Useful for ignoring dark regions or noise floor. Default: 0.0""",
     # Read input image
     try:
         img = fabio.open(args.input_file)
-        data = img.data.astype(np.float64)
+        data = img.data.astype(np.float32)
     except Exception as e:
         print(f"Error reading input file: {e}")
         return
@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+import el_ltp_tools.cosmic as cosmic
+from el_ltp_tools.cosmic import (
+    detect_cosmic_rays,
+    detect_cosmic_rays_multiple_iterations,
+)
+
+
+def _random_frame(shape, rng):
+    """Create a frame with cosmic rays, zeros, negative values and NaNs."""
+    data = rng.poisson(100, size=shape).astype(np.float32)
+    data[rng.random(shape) < 0.02] = 5000
+    data[rng.random(shape) < 0.05] = 0
+    data[rng.random(shape) < 0.05] = -10
+    data[rng.random(shape) < 0.02] = np.nan
+    # Cosmic rays in the corners, where the windows reach over the edges
+    data[0, 0] = data[-1, -1] = 5000
+    return data
+
+
+def _high_count_frame(shape, rng):
+    """Create a frame with a high background, where float32 statistics fail."""
+    data = np.round(rng.normal(60000, 30, size=shape)).astype(np.float32)
+    data[rng.random(shape) < 0.001] = 65000
+    return data
+
+
+def _reference_mask(data, sigma, window_size, min_intensity):
+    """Detect cosmic rays with the statistics of the original float64 code."""
+    data = data.astype(np.float64)
+    positive_mask = data > 0
+    data_positive = np.where(positive_mask, data, 0)
+    count_positive = ndimage.uniform_filter(
+        positive_mask.astype(float), size=window_size
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        local_mean = np.where(
+            count_positive > 0,
+            ndimage.uniform_filter(data_positive, size=window_size) / count_positive,
+            0,
+        )
+        local_var = np.where(
+            count_positive > 0,
+            ndimage.uniform_filter(data_positive**2, size=window_size)
+            / count_positive
+            - local_mean**2,
+            0,
+        )
+    local_std = np.sqrt(np.maximum(local_var, 0))
+    valid_mask = positive_mask & (local_std > 0)
+    z_scores = np.zeros_like(data)
+    z_scores[valid_mask] = (data[valid_mask] - local_mean[valid_mask]) / (
+        local_std[valid_mask] + 1e-10
+    )
+    combined_mask = (z_scores > sigma) | (data > 2 * local_mean)
+    return combined_mask & positive_mask & (data > min_intensity)
+
+
+def test_detection_high_counts(monkeypatch):
+    """Test that the statistics of high-count frames keep their precision."""
+    monkeypatch.setattr(cosmic, "njit", None)
+    data = _high_count_frame((256, 256), np.random.default_rng(0))
+
+    mask = detect_cosmic_rays(data, sigma=3, window_size=5, min_intensity=50)
+
+    expected = _reference_mask(data, sigma=3, window_size=5, min_intensity=50)
+    assert expected.any()
+    np.testing.assert_array_equal(mask, expected)
+
+
+@pytest.mark.parametrize(
+    "shape, window_size",
+    [
+        ((61, 47), 5),
+        ((61, 47), 10),
+        ((7, 5), 9),
+        ((3, 4), 12),
+        ((20, 30), 1),
+        ((30, 150), 7),
+    ],
+)
+def test_numba_window_sums(shape, window_size):
+    """Test that the Numba window sums match the ndimage filters."""
+    pytest.importorskip("numba")
+    data = _random_frame(shape, np.random.default_rng(0))
+
+    sums = tuple(np.empty(shape) for _ in range(3))
+    cosmic._window_sums_kernel(data, window_size, *sums)
+
+    # The kernel returns sums, ndimage the means over the window
+    positive_mask = data > 0
+    data_positive = np.where(positive_mask, data, 0).astype(np.float64)
+    expected = [
+        ndimage.uniform_filter(values, size=window_size) * window_size**2
+        for values in (data_positive, positive_mask.astype(float), data_positive**2)
+    ]
+    for result, reference in zip(sums, expected):
+        np.testing.assert_allclose(result, reference, rtol=1e-10)
+
+
+@pytest.mark.parametrize(
+    "shape, window_size",
+    [((61, 47), 5), ((61, 47), 10), ((7, 5), 9), ((3, 4), 12)],
+)
+def test_numba_detection(monkeypatch, shape, window_size):
+    """Test that the Numba kernels find the same cosmic rays as ndimage."""
+    pytest.importorskip("numba")
+    data = _random_frame(shape, np.random.default_rng(1))
+
+    numba_mask = detect_cosmic_rays(
+        data, sigma=3, window_size=window_size, min_intensity=50
+    )
+    monkeypatch.setattr(cosmic, "njit", None)
+    ndimage_mask = detect_cosmic_rays(
+        data, sigma=3, window_size=window_size, min_intensity=50
+    )
+
+    assert ndimage_mask.any()
+    np.testing.assert_array_equal(numba_mask, ndimage_mask)
+
+
+def test_numba_detection_high_counts():
+    """Test that the Numba statistics of high-count frames keep their precision."""
+    pytest.importorskip("numba")
+    data = _high_count_frame((256, 256), np.random.default_rng(0))
+
+    mask = detect_cosmic_rays(data, sigma=3, window_size=5, min_intensity=50)
+
+    expected = _reference_mask(data, sigma=3, window_size=5, min_intensity=50)
+    assert expected.any()
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_multiple_iterations_strips(monkeypatch):
+    """Test that processing the image in strips finds the same cosmic rays."""
+    rng = np.random.default_rng(0)
+    image = rng.poisson(100, size=(97, 64)).astype(np.uint16)
+    # Clusters of cosmic rays, so that later iterations find more of them
+    for y, x in rng.integers(0, 60, size=(60, 2)):
+        image[y : y + 3, x : x + 2] = rng.integers(150, 400, size=(3, 2))
+
+    whole_log = []
+    whole = detect_cosmic_rays_multiple_iterations(
+        image,
+        sigma=3,
+        window_size=7,
+        iterations=3,
+        min_intensity=50,
+        log=whole_log.append,
+    )
+
+    # Strips of 10 rows of 64 pixels
+    monkeypatch.setattr(cosmic, "_STRIP_PIXELS", 640)
+    strips_log = []
+    strips = detect_cosmic_rays_multiple_iterations(
+        image,
+        sigma=3,
+        window_size=7,
+        iterations=3,
+        min_intensity=50,
+        log=strips_log.append,
+    )
+
+    assert whole.any()
+    np.testing.assert_array_equal(strips, whole)
+    # The counts of the strips are those of the whole image
+    assert len(whole_log) == 1
+    assert strips_log == whole_log
+
+
+def test_multiple_iterations_high_counts():
+    """Test that the reused buffers keep the precision of high-count frames."""
+    image = _high_count_frame((128, 96), np.random.default_rng(2))
+
+    mask = detect_cosmic_rays_multiple_iterations(
+        image, sigma=3, window_size=5, iterations=3, min_intensity=50
+    )
+
+    expected = np.zeros(image.shape, dtype=bool)
+    image = image.astype(np.float64)
+    for _ in range(3):
+        cosmic_mask = _reference_mask(image, sigma=3, window_size=5, min_intensity=50)
+        image[cosmic_mask] = np.nan
+        expected |= cosmic_mask
+    assert expected.any()
+    np.testing.assert_array_equal(mask, expected)
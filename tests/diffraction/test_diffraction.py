@@ -83,6 +83,13 @@ def test_integrate_multi_invalid_config():
         integrate_multi("input", "output", {"invalid": {"no_calibration": "test"}})
 
 
+def test_integrate_multi_validates_files_first(temp_dir):
+    """Test that missing files are reported before masks and calibrations are loaded."""
+    config = {"missing": {"calibration": "missing.poni", "mask": "missing.mask"}}
+    with pytest.raises(ValueError, match="No files found"):
+        integrate_multi(temp_dir, os.path.join(temp_dir, "output"), config)
+
+
 def test_detector_config_typing():
     """Test that DetectorConfig has the correct structure."""
     # Valid config
@@ -127,6 +134,70 @@ def test_integrate_multi_output_files(temp_dir, mock_config):
         assert len(q) == len(I)
 
 
+def test_integrate_multi_batch_size(temp_dir, mock_config):
+    """Test that batched integration gives the same patterns as single frames."""
+    single_dir = os.path.join(temp_dir, "single")
+    batch_dir = os.path.join(temp_dir, "batch")
+
+    single_patterns, _ = integrate_multi(temp_dir, single_dir, mock_config)
+    # Batch size 2 also covers the incomplete last batch of the 3 frames
+    batch_patterns, output_filenames = integrate_multi(
+        temp_dir, batch_dir, mock_config, batch_size=2
+    )
+
+    assert len(batch_patterns) == 3
+    assert sorted(os.listdir(batch_dir)) == sorted(os.listdir(single_dir))
+    assert [os.path.dirname(f) for f in output_filenames] == [batch_dir] * 3
+    for (q_single, I_single), (q_batch, I_batch) in zip(single_patterns, batch_patterns):
+        np.testing.assert_allclose(q_batch, q_single)
+        np.testing.assert_allclose(I_batch, I_single, rtol=1e-4)
+
+
+def test_integrate_multi_gpu_fallback(temp_dir, mock_config, monkeypatch):
+    """Test that GPU integration falls back to the CPU without CuPy."""
+    import el_ltp_tools.diffraction as diffraction
+
+    monkeypatch.setattr(diffraction, "cupy", None)
+    messages = []
+    cpu_patterns, _ = integrate_multi(temp_dir, os.path.join(temp_dir, "cpu"), mock_config)
+    gpu_patterns, _ = integrate_multi(
+        temp_dir,
+        os.path.join(temp_dir, "gpu"),
+        mock_config,
+        progress_callback=messages.append,
+        use_gpu=True,
+    )
+
+    assert "CuPy is not installed, integrating on the CPU" in messages
+    for (_, I_cpu), (_, I_gpu) in zip(cpu_patterns, gpu_patterns):
+        np.testing.assert_allclose(I_gpu, I_cpu, rtol=1e-4)
+
+
+def test_integrate_multi_h5_output(temp_dir, mock_config):
+    """Test that all patterns can be saved into a single HDF5 file."""
+    import h5py
+
+    output_dir = os.path.join(temp_dir, "output")
+    integrated_patterns, pattern_names = integrate_multi(
+        temp_dir, output_dir, mock_config, output_format="h5"
+    )
+
+    assert os.listdir(output_dir) == ["test.h5"]
+    assert pattern_names == ["test_0001", "test_0002", "test_0003"]
+    with h5py.File(os.path.join(output_dir, "test.h5"), "r") as f:
+        assert f["I"].shape == (3, len(integrated_patterns[0][0]))
+        assert list(f["name"].asstr()) == pattern_names
+        for (q, I), I_saved in zip(integrated_patterns, f["I"]):
+            np.testing.assert_allclose(f["q"][:], q)
+            np.testing.assert_allclose(I_saved, I, rtol=1e-6)
+
+
+def test_integrate_multi_invalid_batch_size(temp_dir, mock_config):
+    """Test that integrate_multi rejects batch sizes smaller than 1."""
+    with pytest.raises(ValueError, match="Batch size"):
+        integrate_multi(temp_dir, os.path.join(temp_dir, "output"), mock_config, batch_size=0)
+
+
 def test_integrate_multi_empty_directory(temp_dir, mock_config):
     """Test that integrate_multi handles empty directory correctly."""
     # Create empty output directory
@@ -1,10 +1,16 @@
 import os
+import json
 import tempfile
 import shutil
 import pytest
 from PyQt6.QtWidgets import QApplication, QFileDialog
 from PyQt6.QtCore import Qt, QEventLoop, QTimer
-from el_ltp_tools.diffraction.integrate_multi_gui import MainWindow, IntegrationWorker
+from el_ltp_tools.diffraction.integrate_multi_gui import (
+    MainWindow,
+    IntegrationWorker,
+    RightAlignElideLeftDelegate,
+    offset_patterns,
+)
 import numpy as np
 import fabio.tifimage
 from PIL import Image
@@ -376,7 +382,8 @@ def test_integration_worker_stop(qtbot, worker_setup, mock_state):
     # Check for errors
     assert len(error_messages) == 0, f"Errors occurred: {error_messages}"
     
-    # Clean up
+    # Clean up, the thread may still be returning from run()
+    worker.wait()
     worker.deleteLater()
     qtbot.wait(100)
 
@@ -420,4 +427,159 @@ def test_main_window_plotting(qtbot, temp_dir, mock_state):
     # Check that the log doesn't contain any error messages
     log_text = window.log_output.toPlainText()
     assert "Error plotting patterns" not in log_text
-    window.close() 
\ No newline at end of file
+    window.close() 
+
+
+def test_main_window_plotting_many_patterns(qtbot, mock_state):
+    """Test plotting more patterns than are shown in the legend."""
+    window = MainWindow()
+    qtbot.addWidget(window)
+
+    q = np.linspace(0, 10, 100)
+    patterns = [(q, np.sin(q) + i) for i in range(30)]
+    pattern_names = [f"Pattern {i+1}" for i in range(30)]
+
+    window.integration_finished(patterns, pattern_names)
+
+    log_text = window.log_output.toPlainText()
+    assert "Error plotting patterns" not in log_text
+    window.close()
+
+
+def test_offset_patterns():
+    """Test that patterns are offset by a fraction of the intensity range."""
+    q = np.linspace(0, 10, 5)
+    patterns = [(q, np.arange(5.0)), (q, np.arange(5.0))]
+    segments, min_intensity, max_intensity = offset_patterns(patterns)
+    np.testing.assert_allclose(segments[0][:, 0], q)
+    np.testing.assert_allclose(segments[1][:, 1], np.arange(5.0) + 0.2)
+    assert min_intensity == 0
+    assert max_intensity == pytest.approx(4.2)
+
+    # Patterns with different lengths are offset one by one
+    patterns.append((q[:3], np.arange(3.0)))
+    segments, _, max_intensity = offset_patterns(patterns)
+    np.testing.assert_allclose(segments[2][:, 1], np.arange(3.0) + 0.4)
+    assert max_intensity == pytest.approx(4.4)
+
+
+def test_delegate_elided_text_cache(qapp):
+    """Test that the file path delegate caches elided texts."""
+    delegate = RightAlignElideLeftDelegate()
+    font = qapp.font()
+    text = "/a/very/long/path/to/a/calibration/file.poni"
+
+    elided = delegate.elided_text(text, font, 50)
+    assert elided != text
+    assert elided.endswith("poni")
+    assert delegate.elided_text(text, font, 50) is elided
+    assert delegate.elided_text(text, font, 10000) == text
+
+
+def test_log_output(qtbot, mock_state):
+    """Test that errors are logged in red and the log is limited in length."""
+    window = MainWindow()
+    qtbot.addWidget(window)
+
+    window.log("Processing files\nWriting integrated pattern to: pattern_001.xy")
+    window.log("Error: Something went wrong")
+    assert window.log_output.toPlainText().endswith(
+        "Writing integrated pattern to: pattern_001.xy\nError: Something went wrong"
+    )
+    block = window.log_output.document().lastBlock()
+    assert block.begin().fragment().charFormat().foreground().color().name() == "#ff0000"
+
+    for i in range(6000):
+        window.log(f"Message {i}")
+    assert window.log_output.document().blockCount() == 5000
+    window.close()
+
+
+def test_load_state(qtbot, temp_dir, monkeypatch):
+    """Test that the configuration table is restored from the state file."""
+    state_file = os.path.join(temp_dir, "state.json")
+    with open(state_file, "w") as f:
+        json.dump(
+            {
+                "config_table": [
+                    {"name": "center", "calibration": "a.poni", "mask": "a.mask"},
+                    {"name": "side", "calibration": "b.poni", "mask": "b.mask"},
+                    {"name": "top", "calibration": "c.poni", "mask": "c.mask"},
+                ]
+            },
+            f,
+        )
+    monkeypatch.setattr(MainWindow, "get_state_file_path", lambda self: state_file)
+    monkeypatch.setattr(MainWindow, "save_state", lambda self: None)
+
+    window = MainWindow()
+    qtbot.addWidget(window)
+
+    assert window.config_table.rowCount() == 3
+    assert window.config_table.item(2, 0).text() == "top"
+    assert window.config_table.item(2, 1).toolTip() == "c.poni"
+    assert window.config_table.item(2, 3).text() == "c.mask"
+    assert not window.config_table.signalsBlocked()
+    window.close()
+
+
+def test_main_window_plotting_reuses_dialog(qtbot, mock_state):
+    """Test that repeated integrations are plotted into the same dialog."""
+    window = MainWindow()
+    qtbot.addWidget(window)
+
+    q = np.linspace(0, 10, 100)
+    window.integration_finished([(q, np.sin(q))], ["Pattern 1"])
+    plot_dialog = window.plot_dialog
+    window.integration_finished([(q, np.cos(q)), (q, np.sin(q))], ["A", "B"])
+
+    assert window.plot_dialog is plot_dialog
+    assert len(window.plot_figure.axes) == 1
+    assert "Error plotting patterns" not in window.log_output.toPlainText()
+    window.close()
+
+
+def test_browse_button_after_row_removal(qtbot, mock_config_files, mock_state, monkeypatch):
+    """Test that browse buttons select files for their current row."""
+    window = MainWindow()
+    qtbot.addWidget(window)
+    window.show()
+    qtbot.waitExposed(window)
+
+    monkeypatch.setattr(
+        QFileDialog,
+        "getOpenFileName",
+        lambda parent, title, start_dir, filter: (mock_config_files["poni"], filter),
+    )
+
+    # Remove the first row, the former second row is now the first one
+    window.config_table.selectRow(0)
+    window.remove_config_row()
+    qtbot.wait(50)  # Let the table move the cell widgets
+    window.config_table.cellWidget(0, 2).click()
+
+    assert window.config_table.item(0, 0).text() == "side"
+    assert window.config_table.item(0, 1).text() == mock_config_files["poni"]
+    window.close()
+
+
+def test_get_config_table_data_cache(qtbot, mock_config_files, mock_state):
+    """Test that the cached configuration follows changes of the table."""
+    window = MainWindow()
+    qtbot.addWidget(window)
+    window.config_table.item(0, 1).setText(mock_config_files["poni"])
+    window.config_table.item(0, 3).setText(mock_config_files["mask"])
+
+    config_data = window.get_config_table_data()
+    assert list(config_data) == ["center"]
+    assert window.get_config_table_data() is config_data
+
+    window.config_table.item(0, 0).setText("top")
+    assert list(window.get_config_table_data()) == ["top"]
+
+    window.add_config_row()
+    assert len(window.get_config_rows()) == 3
+    window.config_table.selectRow(0)
+    window.remove_config_row()
+    assert window.get_config_table_data() == {}
+    window.close()
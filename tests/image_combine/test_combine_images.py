@@ -75,6 +75,97 @@ def test_combine_images_in_directory(temp_dir):
     )
 
 
+def test_combine_images_in_directory_many_images(tmp_path):
+    """Test that streaming more images than loader threads sums all of them."""
+    from PIL import Image
+
+    for i in range(12):
+        img_data = np.full((50, 50), i + 1, dtype=np.float32)
+        if i == 3:
+            img_data[20, 20] = 1000  # Cosmic ray
+        Image.fromarray(img_data).save(tmp_path / f"img_{i:02d}.tif")
+
+    combined = combine_images_in_directory(
+        str(tmp_path),
+        cosmic_sigma=6.0,
+        cosmic_window=10,
+        cosmic_iterations=3,
+        cosmic_min=50.0,
+    )
+
+    assert combined.dtype == np.float64
+    assert np.all(combined[:10] == 78.0)
+    # The cosmic ray is replaced with the average of the other images
+    assert combined[20, 20] == pytest.approx(74.0 + 74.0 / 11)
+
+
+def test_combine_images_in_directory_sum_precision(tmp_path):
+    """Test that the sum keeps integer precision beyond the float32 range."""
+    from PIL import Image
+
+    for i, value in enumerate([2**24 - 1, 1, 1]):
+        img_data = np.full((20, 20), value, dtype=np.float32)
+        Image.fromarray(img_data).save(tmp_path / f"img_{i}.tif")
+
+    combined = combine_images_in_directory(
+        str(tmp_path),
+        cosmic_sigma=6.0,
+        cosmic_window=10,
+        cosmic_iterations=1,
+        cosmic_min=2**25,
+    )
+
+    np.testing.assert_array_equal(combined, np.full((20, 20), 2.0**24 + 1))
+
+
+def test_combine_images_in_directory_high_counts(tmp_path, monkeypatch):
+    """Test that the cosmic rays of high-count images are found in float64."""
+    from PIL import Image
+    import el_ltp_tools.cosmic as cosmic
+    from el_ltp_tools.cosmic import detect_cosmic_rays
+
+    monkeypatch.setattr(cosmic, "njit", None)
+    rng = np.random.default_rng(0)
+    expected = []
+    for i in range(2):
+        img_data = np.round(rng.normal(60000, 30, size=(128, 128)))
+        Image.fromarray(img_data.astype(np.float32)).save(tmp_path / f"img_{i}.tif")
+        mask = detect_cosmic_rays(img_data, 3.0, 5, 50.0)
+        expected.append(f"        Found cosmic rays: {np.count_nonzero(mask)}")
+
+    messages = []
+    combine_images_in_directory(
+        str(tmp_path),
+        cosmic_sigma=3.0,
+        cosmic_window=5,
+        cosmic_iterations=1,
+        cosmic_min=50.0,
+        log=messages.append,
+    )
+
+    assert sorted(messages) == sorted(expected)
+
+
+def test_combine_images_in_directory_single_image(tmp_path):
+    """Test that the cosmic rays of a single image are set to NaN."""
+    from PIL import Image
+
+    img_data = np.ones((50, 50), dtype=np.float32)
+    img_data[20, 20] = 1000  # Cosmic ray
+    Image.fromarray(img_data).save(tmp_path / "img.tif")
+
+    combined = combine_images_in_directory(
+        str(tmp_path),
+        cosmic_sigma=6.0,
+        cosmic_window=10,
+        cosmic_iterations=3,
+        cosmic_min=50.0,
+    )
+
+    assert np.isnan(combined[20, 20])
+    assert np.nansum(combined) == 50 * 50 - 1
+
+
 def test_get_directory_groups(temp_dir):
     """Test grouping directories based on configuration."""
     config = [{"center": 2, "side": 2}]
@@ -120,6 +211,127 @@ def test_process_measurements(temp_dir):
     assert (output_dir / "test_center_0001.tif").exists()
     assert (output_dir / "test_side_0001.tif").exists()
 
+    # The float64 sums are written as float32
+    from PIL import Image
+
+    with Image.open(output_dir / "test_center_0001.tif") as image:
+        assert np.asarray(image).dtype == np.float32
+
+
+def test_process_measurements_log(temp_dir, capsys):
+    """Test that progress messages are passed to the log function."""
+    messages = []
+    config = [{"center": 1}]  # The configuration can also be passed parsed
+    process_measurements(
+        input_directory=str(temp_dir),
+        output_directory=str(temp_dir / "output"),
+        config=config,
+        start_index=2,
+        end_index=2,
+        cosmic_sigma=6.0,
+        cosmic_window=10,
+        cosmic_iterations=1,
+        cosmic_min=50.0,
+        prefix="test",
+        log=messages.append,
+    )
+
+    assert "    Combining data from g2" in messages
+    assert any(message.startswith("    Writing combined data") for message in messages)
+    assert capsys.readouterr().out == ""
+
+
+def test_process_measurements_workers(temp_dir):
+    """Test that worker processes give the same result as serial processing."""
+    config = json.dumps([{"center": 2}])
+    for num_workers in (1, 2):
+        messages = []
+        process_measurements(
+            input_directory=str(temp_dir),
+            output_directory=str(temp_dir / f"output_{num_workers}"),
+            config=config,
+            start_index=2,
+            end_index=3,
+            cosmic_sigma=6.0,
+            cosmic_window=10,
+            cosmic_iterations=1,
+            cosmic_min=50.0,
+            prefix="test",
+            log=messages.append,
+            num_workers=num_workers,
+        )
+        assert any(message.startswith("        Found cosmic rays") for message in messages)
+
+    from PIL import Image
+
+    serial = np.array(Image.open(temp_dir / "output_1" / "test_center_0001.tif"))
+    parallel = np.array(Image.open(temp_dir / "output_2" / "test_center_0001.tif"))
+    np.testing.assert_array_equal(serial, parallel)
+
+    with pytest.raises(ValueError):
+        process_measurements(
+            str(temp_dir), str(temp_dir / "output"), config, 2, 3,
+            6.0, 10, 1, 50.0, "test", num_workers=0,
+        )
+
+
+def test_process_measurements_gpu_fallback(temp_dir, monkeypatch):
+    """Test that GPU cosmic ray detection falls back to the CPU without CuPy."""
+    import el_ltp_tools.combine_images as combine_images
+
+    monkeypatch.setattr(combine_images, "cupy", None)
+    messages = []
+    process_measurements(
+        input_directory=str(temp_dir),
+        output_directory=str(temp_dir / "output"),
+        config=json.dumps([{"center": 1}]),
+        start_index=2,
+        end_index=2,
+        cosmic_sigma=6.0,
+        cosmic_window=10,
+        cosmic_iterations=1,
+        cosmic_min=50.0,
+        prefix="test",
+        log=messages.append,
+        use_gpu=True,
+    )
+
+    assert "CuPy is not installed, detecting cosmic rays on the CPU" in messages
+    assert (temp_dir / "output" / "test_center_0001.tif").exists()
+
+
+def test_process_measurements_write_error_after_stop(temp_dir, monkeypatch):
+    """Test that a failed write is raised also when the processing is stopped."""
+    import el_ltp_tools.combine_images as combine_images
+
+    def failing_save(filename, data):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(combine_images, "_save_image", failing_save)
+    messages = []
+
+    # Stop as soon as the first combined image is written
+    def keep_running():
+        return not any(message.startswith("    Writing") for message in messages)
+
+    with pytest.raises(OSError, match="Disk full"):
+        process_measurements(
+            input_directory=str(temp_dir),
+            output_directory=str(temp_dir / "output"),
+            config=[{"center": 1}],
+            start_index=2,
+            end_index=5,
+            cosmic_sigma=6.0,
+            cosmic_window=10,
+            cosmic_iterations=1,
+            cosmic_min=50.0,
+            prefix="test",
+            callback=keep_running,
+            log=messages.append,
+        )
+
+    assert "    Combining data from g3" not in messages
+
 
 def test_invalid_configuration():
     """Test handling of invalid configurations."""
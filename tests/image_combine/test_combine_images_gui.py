@@ -100,6 +100,19 @@ def test_config_table_operations(main_window, qtbot):
     assert main_window.config_table.rowCount() == initial_rows
 
 
+def test_config_json_cache(main_window, qtbot):
+    """Test that the configuration JSON is cached until the table changes."""
+    config_json = main_window.get_config_json()
+    assert json.loads(config_json) == [{"center": 2, "side": 2}]
+    assert main_window.get_config_json() is config_json
+
+    main_window.config_table.item(1, 1).setText("3")
+    assert json.loads(main_window.get_config_json()) == [{"center": 2, "side": 3}]
+
+    main_window.config_table.removeRow(0)
+    assert json.loads(main_window.get_config_json()) == [{"side": 3}]
+
+
 def test_config_table_validation(main_window, qtbot):
     """Test validation of configuration table entries."""
     # Add a new row
@@ -157,6 +170,17 @@ def test_log_operations(main_window, qtbot):
     assert main_window.log_output.toPlainText() == ""
 
 
+def test_log_formatting_and_limit(main_window, qtbot):
+    """Test that errors are logged in red and the log is limited in length."""
+    main_window.log("Error: Test error")
+    block = main_window.log_output.document().lastBlock()
+    assert block.begin().fragment().charFormat().foreground().color().name() == "#ff0000"
+
+    for i in range(6000):
+        main_window.log(f"Message {i}")
+    assert main_window.log_output.document().blockCount() == 5000
+
+
 def test_state_saving_and_loading(main_window, qtbot, tmp_path):
     """Test saving and loading application state."""
     # Modify some values
@@ -164,6 +188,8 @@ def test_state_saving_and_loading(main_window, qtbot, tmp_path):
     main_window.start_idx.setValue(5)
     main_window.end_idx.setValue(10)
     main_window.cosmic_sigma.setValue(7.0)
+    main_window.num_workers.setValue(main_window.num_workers.maximum())
+    main_window.cosmic_device.setCurrentText("CUDA")
     
     # Save state
     main_window.save_state()
@@ -180,6 +206,44 @@ def test_state_saving_and_loading(main_window, qtbot, tmp_path):
     assert new_window.start_idx.value() == 5
     assert new_window.end_idx.value() == 10
     assert new_window.cosmic_sigma.value() == 7.0
+    assert new_window.num_workers.value() == main_window.num_workers.maximum()
+    assert new_window.cosmic_device.currentText() == "CUDA"
+
+
+def test_conversion_device(main_window, qtbot):
+    """Test that the selected device is passed to the conversion."""
+    main_window.cosmic_device.setCurrentText("CUDA")
+
+    with patch(
+        "el_ltp_tools.combine_images.combine_images_gui.process_measurements"
+    ) as process:
+        main_window.start_conversion()
+        qtbot.waitUntil(lambda: not main_window.worker.isRunning(), timeout=5000)
+
+    assert process.call_args.kwargs["use_gpu"] is True
+
+
+def test_state_saved_after_change(main_window, qtbot, mock_state_file):
+    """Test that the state is saved shortly after a setting was changed."""
+    main_window.prefix.setText("changed_prefix")
+
+    def state_saved():
+        assert mock_state_file.exists()
+        with open(mock_state_file) as f:
+            assert json.load(f)["prefix"] == "changed_prefix"
+
+    qtbot.waitUntil(state_saved, timeout=2000)
+    assert not os.path.exists(str(mock_state_file) + ".tmp")
+
+
+def test_save_state_error(main_window, mock_state_file):
+    """Test that a failed state save is logged instead of raised."""
+    # A directory in place of the state file makes replacing it fail
+    mock_state_file.mkdir()
+    main_window.save_state()
+
+    assert "Error saving state" in main_window.log_output.toPlainText()
+    assert not os.path.exists(str(mock_state_file) + ".tmp")
 
 
 def test_conversion_controls(main_window, qtbot):
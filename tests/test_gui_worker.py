@@ -0,0 +1,40 @@
+import threading
+
+from el_ltp_tools.gui_worker import ProgressWorker
+
+
+class _WaitingWorker(ProgressWorker):
+    """Worker which queues progress messages and waits until it is released."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def run(self):
+        for i in range(100):
+            self._queue_progress(f"Message {i}")
+        self.release.wait(5)
+        self._flush_progress()
+
+
+def test_progress_worker_batches_progress(qtbot):
+    """Test that progress messages arrive in batches while the worker is busy."""
+    worker = _WaitingWorker()
+    progress_messages = []
+    worker.progress.connect(progress_messages.append)
+
+    worker.start()
+    try:
+        # No further message follows, so the timer has to send the batches
+        qtbot.waitUntil(
+            lambda: "\n".join(progress_messages).count("\n") == 99, timeout=2000
+        )
+        assert worker.isRunning()
+    finally:
+        worker.release.set()
+        worker.wait()
+
+    assert len(progress_messages) < 100
+    assert "\n".join(progress_messages).split("\n") == [
+        f"Message {i}" for i in range(100)
+    ]